@@ -1,18 +1,32 @@
-from flask import Flask, request, jsonify, render_template, send_file
+import time
+
+# Cold start is measured from here: imports, model load and warm-up
+BOOT_STARTED = time.perf_counter()
+
+from flask import Flask, request, jsonify, render_template, send_file, stream_with_context
 from flask_cors import CORS
 from flask_caching import Cache
 from flask_compress import Compress
-import joblib
 import numpy as np
-import pandas as pd
 from datetime import datetime
 import os
 import warnings
-import io
-import gzip
-import time
-from werkzeug.utils import secure_filename
+import math
+import threading
 from functools import wraps
+from micro_batching import MicroBatcher
+from model_registry import ModelRegistry
+from rate_limiter import create_bucket_store
+from prediction_cache import PredictionCache
+from request_schema import RequestSchema, SchemaError
+from feature_store import FeatureStore, LoginJournal
+from warmup import warm_up_bundle
+from metrics import Metrics
+from chunk_pipeline import ordered_parallel_map, default_workers
+from batch_formats import (MIMETYPES, SEEKABLE_FORMATS, ColumnarWriter, column_names, detect_format,
+                           format_for_mimetype, iter_frames, to_table)
+from upload_stream import UploadError, hold_until, open_upload, spool
+from batch_jobs import JobManager
 
 # Suppress warnings
 warnings.filterwarnings('ignore')
@@ -30,105 +44,359 @@ cache = Cache(config={
 })
 cache.init_app(app)
 
-# Load all trained models
-print("Loading trained models...")
+# Create dummy features for demo mode
+dummy_features = ['ASN', 'hour', 'day_of_week', 'month', 'day_of_month', 'week_of_year', 'is_weekend', 'is_business_hour', 'hour_sin', 'hour_cos', 'day_sin', 'day_cos', 'Country_freq', 'Region_freq', 'City_freq', 'Browser Name and Version_freq', 'OS Name and Version_freq', 'Device Type_freq', 'rtt_category_fine', 'rtt_log', 'rtt_sqrt', 'rtt_reciprocal', 'user_login_count', 'user_rtt_mean', 'user_rtt_std', 'user_rtt_min', 'user_rtt_max', 'user_total_logins', 'ip_login_count', 'ip_rtt_mean', 'ip_rtt_std', 'ip_unique_users', 'hour_country_interaction', 'day_country_interaction', 'ip_attack_count']
 
-try:
-    # Round-Trip Time Model
-    rtt_model = joblib.load('models/rtt_model_model.pkl')
-    rtt_scaler = joblib.load('models/rtt_model_scaler.pkl')
-    rtt_features = joblib.load('models/rtt_model_features.pkl')
-    rtt_selector = joblib.load('models/rtt_model_selector.pkl')
+# Route name -> bundle name in models/ (override to roll out e.g. rtt_enhanced)
+MODEL_BUNDLES = {
+    'rtt': os.environ.get('RTT_MODEL_BUNDLE', 'rtt_model'),
+    'login': os.environ.get('LOGIN_MODEL_BUNDLE', 'login_model'),
+    'attack': os.environ.get('ATTACK_MODEL_BUNDLE', 'attack_model'),
+}
 
-    print("✅ RTT model loaded successfully!")
-    RTT_MODEL_LOADED = True
+MODEL_TYPES = {
+    'rtt': 'RandomForest Regressor',
+    'login': 'RandomForest Classifier',
+    'attack': 'GradientBoosting',
+}
 
-except Exception as e:
-    print(f"❌ Error loading RTT model: {e}")
-    RTT_MODEL_LOADED = False
+# Micro-batching configuration (max rows per model call / max time a row waits)
+MICRO_BATCH_MAX_SIZE = int(os.environ.get('MICRO_BATCH_MAX_SIZE', 32))
+MICRO_BATCH_MAX_WAIT_MS = float(os.environ.get('MICRO_BATCH_MAX_WAIT_MS', 2))
 
-try:
-    # Login Success Model
-    login_model = joblib.load('models/login_model_model.pkl')
-    login_scaler = joblib.load('models/login_model_scaler.pkl')
-    login_features = joblib.load('models/login_model_features.pkl')
-    login_selector = joblib.load('models/login_model_selector.pkl')
+# Prediction result cache per model (entries, seconds); size 0 disables it
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 10000))
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 300))
 
-    print("✅ Login model loaded successfully!")
-    LOGIN_MODEL_LOADED = True
+# Warm-up run on every freshly loaded bundle (batch sizes, passes); 0 passes disables
+WARMUP_BATCH_SIZES = tuple(int(size) for size in os.environ.get('WARMUP_BATCH_SIZES', '1,32,1024').split(','))
+WARMUP_ROUNDS = int(os.environ.get('WARMUP_ROUNDS', 3))
 
-except Exception as e:
-    print(f"❌ Error loading Login model: {e}")
-    LOGIN_MODEL_LOADED = False
+def attach_serving_state(bundle):
+    """Give each loaded bundle its own micro-batcher and result cache.
 
-try:
-    # Attack Detection Model
-    attack_model = joblib.load('models/attack_model_model.pkl')
-    attack_scaler = joblib.load('models/attack_model_scaler.pkl')
-    attack_features = joblib.load('models/attack_model_features.pkl')
-    attack_selector = joblib.load('models/attack_model_selector.pkl')
+    Versions never mix in a batch, and a reloaded model starts with an empty cache.
+    """
+    bundle.batcher = MicroBatcher(
+        lambda X: run_pipeline(bundle.name, bundle.pipeline, X),
+        MICRO_BATCH_MAX_SIZE, MICRO_BATCH_MAX_WAIT_MS, bundle.name
+    )
+    bundle.cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL)
+    bundle.schema = RequestSchema(bundle.features)
+    bundle.store_columns = FeatureStore.columns(bundle.features)
 
-    print("✅ Attack model loaded successfully!")
-    ATTACK_MODEL_LOADED = True
+def warm_bundle(bundle):
+    """Warm-up run by the registry outside its load lock: in the background on first load, before the swap on reload"""
+    return warm_up_bundle(bundle, WARMUP_BATCH_SIZES, WARMUP_ROUNDS)
 
-except Exception as e:
-    print(f"❌ Error loading Attack model: {e}")
-    ATTACK_MODEL_LOADED = False
+def detach_serving_state(bundle):
+    """Stop the micro-batcher of a bundle that was replaced or unloaded"""
+    bundle.batcher.close()
 
-# Create dummy features for demo mode
-dummy_features = ['ASN', 'hour', 'day_of_week', 'month', 'day_of_month', 'week_of_year', 'is_weekend', 'is_business_hour', 'hour_sin', 'hour_cos', 'day_sin', 'day_cos', 'Country_freq', 'Region_freq', 'City_freq', 'Browser Name and Version_freq', 'OS Name and Version_freq', 'Device Type_freq', 'rtt_category_fine', 'rtt_log', 'rtt_sqrt', 'rtt_reciprocal', 'user_login_count', 'user_rtt_mean', 'user_rtt_std', 'user_rtt_min', 'user_rtt_max', 'user_total_logins', 'ip_login_count', 'ip_rtt_mean', 'ip_rtt_std', 'ip_unique_users', 'hour_country_interaction', 'day_country_interaction', 'ip_attack_count']
+def run_pipeline(name, pipeline, X):
+    """Run one fused scale + model call, counting calls, rows and latency"""
+    start = time.perf_counter()
+    result = pipeline.predict_and_proba(X)
+    labels = (('model', name),)
+    metrics.observe('model_call_duration_seconds', labels, time.perf_counter() - start)
+    metrics.inc('model_calls_total', labels)
+    metrics.inc('model_rows_total', labels, len(X))
+    return result
+
+def predict_row(bundle, features_array):
+    """Score one feature row, serving repeats from the bundle's result cache"""
+    if not bundle.cache.enabled:
+        return bundle.batcher.predict(features_array)
+    
+    key = bundle.cache.key(features_array)
+    result = bundle.cache.get(key)
+    if result is None:
+        result = bundle.batcher.predict(features_array)
+        bundle.cache.put(key, result)
+    return result
+
+# Per-user and per-IP aggregate features, seeded by training and updated by recorded logins
+FEATURE_STORE_PATH = os.environ.get('FEATURE_STORE_PATH', 'models/feature_store.pkl')
+FEATURE_STORE_MAX_KEYS = int(os.environ.get('FEATURE_STORE_MAX_KEYS', 1000000))
+# Recorded logins are appended here and replayed by every worker and on restart (empty keeps them in memory)
+FEATURE_STORE_JOURNAL = os.environ.get('FEATURE_STORE_JOURNAL', 'models/feature_store_logins.jsonl')
+
+# Seconds a prediction may use the store without checking the journal for new logins
+FEATURE_STORE_SYNC_INTERVAL = float(os.environ.get('FEATURE_STORE_SYNC_INTERVAL', 1))
+# Journal size that folds it into the snapshot and truncates it (0 never compacts)
+FEATURE_STORE_COMPACT_BYTES = int(os.environ.get('FEATURE_STORE_COMPACT_BYTES', 64 * 1024 * 1024))
+
+login_journal = LoginJournal(FEATURE_STORE_JOURNAL) if FEATURE_STORE_JOURNAL else None
+if FEATURE_STORE_MAX_KEYS > 0 and os.path.exists(FEATURE_STORE_PATH):
+    feature_store = FeatureStore.load(FEATURE_STORE_PATH, login_journal)
+    feature_store.max_keys = FEATURE_STORE_MAX_KEYS
+    print(f"✅ Feature store loaded ({len(feature_store)} users and IPs)")
+else:
+    feature_store = FeatureStore(FEATURE_STORE_MAX_KEYS, login_journal, FEATURE_STORE_PATH)
+    feature_store.sync()
+feature_store.sync_interval = FEATURE_STORE_SYNC_INTERVAL
+feature_store.compact_bytes = FEATURE_STORE_COMPACT_BYTES
+
+# Models are loaded lazily on first use and reloaded when their files change
+model_registry = ModelRegistry(
+    'models',
+    check_interval=float(os.environ.get('MODEL_RELOAD_INTERVAL', 2)),
+    idle_timeout=float(os.environ.get('MODEL_IDLE_TIMEOUT', 0)),
+    on_load=attach_serving_state,
+    on_unload=detach_serving_state,
+    warm_up=warm_bundle if WARMUP_ROUNDS > 0 else None,
+    mmap_mode=os.environ.get('MODEL_MMAP_MODE', 'c')
+)
+
+def get_bundle(model):
+    """Current bundle for a route name, or None in demo mode"""
+    return model_registry.get(MODEL_BUNDLES[model])
+
+# Batch CSV scoring: rows per chunk and scoring threads (requests may ask for less or more, up to the max)
+BATCH_CHUNK_SIZE = int(os.environ.get('BATCH_CHUNK_SIZE', 1000))
+BATCH_MAX_CHUNK_SIZE = int(os.environ.get('BATCH_MAX_CHUNK_SIZE', 100000))
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', default_workers()))
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', os.cpu_count() or 1))
+# Memory used to buffer Parquet/Arrow uploads (which need random access) and results
+# held back until an upload has been read; anything larger goes to a temp file
+BATCH_SPOOL_MAX_MEMORY = int(os.environ.get('BATCH_SPOOL_MAX_MEMORY', 32 * 1024 * 1024))
+
+# Largest payload accepted by the bulk prediction route
+BULK_MAX_ROWS = int(os.environ.get('BULK_MAX_ROWS', 50000))
+
+def resolve_model(model):
+    """Look up features and the fused pipeline for a route name, or None if unknown"""
+    if model not in MODEL_BUNDLES:
+        return None
+    bundle = get_bundle(model)
+    features = bundle.features if bundle is not None else dummy_features
+    return {
+        'features': features,
+        # Scored output: the features, then prediction (and probability for classifiers)
+        'columns': features + ['prediction'] + ([] if model == 'rtt' else ['probability']),
+        'loaded': bundle is not None,
+        'name': bundle.name if bundle is not None else model,
+        'version': bundle.version if bundle is not None else None,
+        'model_type': MODEL_TYPES[model],
+        'pipeline': bundle.pipeline if bundle is not None else None
+    }
+
+def build_feature_matrix(payload, features):
+    """Build a float feature matrix from a JSON array of records or a columnar object"""
+    import pandas as pd
+    if isinstance(payload, dict):
+        # Columnar: {"feature": [v1, v2, ...], ...}
+        frame = pd.DataFrame(payload)
+    elif isinstance(payload, list):
+        # Row-oriented: [{"feature": v1, ...}, ...]
+        frame = pd.DataFrame.from_records(payload)
+    else:
+        raise ValueError('Payload must be a JSON array of records or a columnar object')
+
+    # Missing columns and missing values default to 0, like the single-row routes
+    return frame.reindex(columns=features, fill_value=0).fillna(0).to_numpy(dtype=float)
+
+def score_chunk(chunk, spec, model):
+    """Score a chunk of rows, returns its feature columns plus prediction/probability"""
+    result = chunk[spec['features']].copy()
+    
+    if spec['loaded']:
+        predictions, probabilities = run_pipeline(spec['name'], spec['pipeline'], result.fillna(0).values)
+        result['prediction'] = predictions
+        if probabilities is not None:
+            result['probability'] = probabilities[:, 1]
+    else:
+        # Demo mode: random predictions
+        if model != 'rtt':
+            result['prediction'] = np.random.randint(0, 2, size=len(result))
+            result['probability'] = np.random.uniform(0.7, 0.99, size=len(result))
+        else:
+            result['prediction'] = np.random.uniform(10, 100, size=len(result))
+    
+    return result
+
+# Background batch jobs: uploads saved to disk and scored on a local worker pool,
+# resuming from the last completed chunk after a restart
+JOB_DIR = os.path.abspath(os.environ.get('JOB_DIR', 'jobs'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+JOB_CHUNK_SIZE = int(os.environ.get('JOB_CHUNK_SIZE', 50000))
+JOB_RETENTION_HOURS = float(os.environ.get('JOB_RETENTION_HOURS', 168))
+# Seconds between scans for unfinished jobs left behind by a worker that died (0 scans only at startup)
+JOB_RESCAN_SECONDS = float(os.environ.get('JOB_RESCAN_SECONDS', 60))
+
+job_manager = JobManager(
+    JOB_DIR,
+    resolve=resolve_model,
+    score_chunk=lambda model, spec, chunk: score_chunk(chunk, spec, model),
+    workers=JOB_WORKERS,
+    chunk_size=JOB_CHUNK_SIZE,
+    retention=JOB_RETENTION_HOURS * 3600,
+    rescan_interval=JOB_RESCAN_SECONDS,
+)
+
+MODEL_PERFORMANCE = {'rtt': 0.9989, 'login': 0.8420, 'attack': 0.9200}
+
+# Responses returned when a model's files are not available
+DEMO_RESPONSES = {
+    'rtt': {
+        'success': True,
+        'prediction': 45.67,
+        'model_performance': 0.9989,
+        'model_type': 'Enhanced RandomForestRegressor',
+        'demo': True
+    },
+    'login': {
+        'success': True,
+        'prediction': 1,
+        'probability': 0.85,
+        'model_performance': 0.8420,
+        'model_type': 'RandomForest Classifier',
+        'demo': True
+    },
+    'attack': {
+        'success': True,
+        'prediction': 0,
+        'probability': 0.92,
+        'model_performance': 0.9200,
+        'model_type': 'GradientBoosting',
+        'demo': True
+    }
+}
+
+def demo_payload(model):
+    """JSON body for a single-row prediction in demo mode"""
+    return dict(DEMO_RESPONSES[model], timestamp=datetime.now().isoformat())
+
+def prediction_payload(model, prediction, probability, start_time):
+    """JSON body for a single-row prediction"""
+    response_time = int((time.time() - start_time) * 1000)
+    
+    if model == 'rtt':
+        return {
+            'success': True,
+            # Ensure RTT is positive (negative RTT is physically impossible)
+            'prediction': float(max(0, prediction)),
+            # For regression models, a confidence-like metric based on the model's R² score
+            'probability': MODEL_PERFORMANCE['rtt'],
+            'model_performance': MODEL_PERFORMANCE['rtt'],
+            'model_type': MODEL_TYPES['rtt'],
+            'response_time': f'{response_time}ms',
+            'timestamp': datetime.now().isoformat(),
+            'enhanced': True
+        }
+    
+    return {
+        'success': True,
+        'prediction': int(prediction),
+        'probability': float(probability[1] if prediction == 1 else probability[0]),
+        'model_performance': MODEL_PERFORMANCE[model],
+        'model_type': MODEL_TYPES[model],
+        'response_time': f'{response_time}ms',
+        'timestamp': datetime.now().isoformat(),
+        'enhanced': True
+    }
+
+def bulk_prediction_payload(model, spec, X, start_time):
+    """Score a feature matrix in one call and build the columnar JSON body"""
+    n_rows = X.shape[0]
+    probabilities = None
+    if n_rows == 0:
+        predictions = np.empty(0)
+    elif spec['loaded']:
+        # One fused scale + model call for the whole payload
+        predictions, proba = run_pipeline(spec['name'], spec['pipeline'], X)
+        if proba is not None:
+            # Probability of the predicted class, as in the single-row routes
+            probabilities = np.where(predictions == 1, proba[:, -1], proba[:, 0])
+    else:
+        # Demo mode: fixed predictions
+        predictions = np.full(n_rows, 45.67) if model == 'rtt' else np.ones(n_rows, dtype=int)
+        if model != 'rtt':
+            probabilities = np.full(n_rows, 0.85)
+    
+    if model == 'rtt':
+        # Negative RTT is physically impossible
+        predictions = np.maximum(predictions, 0).astype(float)
+    else:
+        predictions = predictions.astype(int)
+    
+    response_time = int((time.time() - start_time) * 1000)
+    
+    result = {
+        'success': True,
+        'count': int(n_rows),
+        'predictions': predictions.tolist(),
+        'model_type': spec['model_type'],
+        'response_time': f'{response_time}ms',
+        'timestamp': datetime.now().isoformat()
+    }
+    if probabilities is not None:
+        result['probabilities'] = probabilities.astype(float).tolist()
+    if not spec['loaded']:
+        result['demo'] = True
+    else:
+        result['enhanced'] = True
+    return result
+
+# Request and per-stage latency histograms, exposed at /metrics
+metrics = Metrics()
 
-if not RTT_MODEL_LOADED:
-    rtt_features = dummy_features.copy()
-if not LOGIN_MODEL_LOADED:
-    login_features = dummy_features.copy()
-if not ATTACK_MODEL_LOADED:
-    attack_features = dummy_features.copy()
+def record_stage(route, stage, start):
+    """Record the time since start for one request stage, returns the new start time"""
+    now = time.perf_counter()
+    metrics.observe('stage_duration_seconds', (('route', route), ('stage', stage)), now - start)
+    return now
 
 # Performance monitoring decorator
 def monitor_performance(f):
+    route_labels = (('route', f.__name__),)
+    
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        start_time = time.time()
+        start_time = time.perf_counter()
         result = f(*args, **kwargs)
-        end_time = time.time()
-        response_time = (end_time - start_time) * 1000  # Convert to milliseconds
+        response_time = time.perf_counter() - start_time
         
-        # Log performance metrics
-        print(f"Performance: {f.__name__} took {response_time:.2f}ms")
+        # Record into the latency histogram instead of logging every request
+        metrics.observe('request_duration_seconds', route_labels, response_time)
         
         # Add performance header to response
         if hasattr(result, 'headers'):
-            result.headers['X-Response-Time'] = f"{response_time:.2f}ms"
+            result.headers['X-Response-Time'] = f"{response_time * 1000:.2f}ms"
         
         return result
     return decorated_function
 
+# Token buckets for rate limiting ('memory' per process, or 'sqlite:///path' shared across workers)
+rate_limit_store = create_bucket_store(os.environ.get('RATE_LIMIT_BACKEND', 'memory'))
+
+# Per-client limits for the prediction routes
+PREDICT_RATE_LIMIT = {'max_requests': 50, 'window': 60}
+BULK_RATE_LIMIT = {'max_requests': 10, 'window': 60}
+
+def consume_rate_limit(key, max_requests, window):
+    """Take a token for key; returns None if allowed, else the seconds until retry"""
+    # Bursts of up to max_requests, refilled at max_requests per window
+    allowed, retry_after = rate_limit_store.consume(key, max_requests / window, max_requests)
+    return None if allowed else max(1, int(math.ceil(retry_after)))
+
+def rate_limit_payload(max_requests, window):
+    return {
+        'error': 'Rate limit exceeded',
+        'message': f'Maximum {max_requests} requests per {window} seconds'
+    }
+
 # Rate limiting decorator
 def rate_limit(max_requests=100, window=60):
     def decorator(f):
-        request_counts = {}
-        
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            client_ip = request.remote_addr
-            current_time = time.time()
-            
-            # Clean old entries
-            request_counts[client_ip] = [
-                req_time for req_time in request_counts.get(client_ip, [])
-                if current_time - req_time < window
-            ]
-            
-            # Check rate limit
-            if len(request_counts[client_ip]) >= max_requests:
-                return jsonify({
-                    'error': 'Rate limit exceeded',
-                    'message': f'Maximum {max_requests} requests per {window} seconds'
-                }), 429
+            retry_after = consume_rate_limit(f"{f.__name__}:{request.remote_addr}", max_requests, window)
             
-            # Add current request
-            request_counts[client_ip].append(current_time)
+            if retry_after is not None:
+                response = jsonify(rate_limit_payload(max_requests, window))
+                response.headers['Retry-After'] = str(retry_after)
+                return response, 429
             
             return f(*args, **kwargs)
         return decorated_function
@@ -140,175 +408,103 @@ def rate_limit(max_requests=100, window=60):
 def index():
     return render_template('index.html')
 
-@app.route('/api/predict/rtt', methods=['POST'])
-@monitor_performance
-@rate_limit(max_requests=50, window=60)
-def predict_rtt():
+def predict_single(model, route):
+    """Shared body of the single-row prediction routes"""
     start_time = time.time()
-    if not RTT_MODEL_LOADED:
-        return jsonify({
-            'success': True,
-            'prediction': 45.67,
-            'model_performance': 0.9989,
-            'model_type': 'Enhanced RandomForestRegressor',
-            'timestamp': datetime.now().isoformat(),
-            'demo': True
-        })
+    bundle = get_bundle(model)
+    if bundle is None:
+        return jsonify(demo_payload(model))
     
     try:
-        data = request.json
-        
-        # Create feature vector
-        features = []
-        for feature in rtt_features:
-            if feature in data:
-                features.append(data[feature])
-            else:
-                features.append(0)  # Default value
-        
-        # Convert to numpy array and reshape
-        features_array = np.array(features).reshape(1, -1)
-        
-        # Scale features
-        features_scaled = rtt_scaler.transform(features_array)
+        stage_start = time.perf_counter()
+        data = bundle.schema.decode(request.get_data(cache=False))
+        stage_start = record_stage(route, 'parse', stage_start)
         
-        # Make prediction
-        prediction = rtt_model.predict(features_scaled)[0]
+        # Validate and write the fields straight into a row in the model's column order
+        features_array = bundle.schema.row(data)
+        # Fill user/IP aggregates the caller did not send from the online feature store (read only)
+        feature_store.fill(features_array, data, bundle.store_columns)
+        stage_start = record_stage(route, 'features', stage_start)
         
-        # Ensure RTT is positive (negative RTT is physically impossible)
-        prediction = max(0, prediction)
+        # Scale and predict (cached, or merged with concurrent requests)
+        prediction, probability = predict_row(bundle, features_array)
+        stage_start = record_stage(route, 'predict', stage_start)
         
-        # Calculate actual response time
-        response_time = int((time.time() - start_time) * 1000)
+        # ?record=1 adds this login to the history; send it on one route per real login
+        if request.args.get('record', type=int):
+            feature_store.record([data])
         
-        # For regression models, calculate a confidence-like metric based on model performance
-        # This is not a true probability but gives users a sense of model reliability
-        confidence = 0.9989  # Based on model's R² score
-        
-        return jsonify({
-            'success': True,
-            'prediction': float(prediction),
-            'probability': confidence,  # Add probability field for consistency
-            'model_performance': 0.9989,  # Default performance score
-            'model_type': 'RandomForest Regressor',
-            'response_time': f'{response_time}ms',
-            'timestamp': datetime.now().isoformat(),
-            'enhanced': True
-        })
+        response = jsonify(prediction_payload(model, prediction, probability, start_time))
+        record_stage(route, 'serialize', stage_start)
+        return response
     
+    except SchemaError as e:
+        return jsonify(e.payload()), 422
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 400
+        }), 500
+
+@app.route('/api/predict/rtt', methods=['POST'])
+@monitor_performance
+@rate_limit(**PREDICT_RATE_LIMIT)
+def predict_rtt():
+    return predict_single('rtt', 'predict_rtt')
 
 @app.route('/api/predict/login', methods=['POST'])
 @monitor_performance
-@rate_limit(max_requests=50, window=60)
+@rate_limit(**PREDICT_RATE_LIMIT)
 def predict_login():
-    start_time = time.time()
-    if not LOGIN_MODEL_LOADED:
-        return jsonify({
-            'success': True,
-            'prediction': 1,
-            'probability': 0.85,
-            'model_performance': 0.8420,
-            'model_type': 'RandomForest Classifier',
-            'timestamp': datetime.now().isoformat(),
-            'demo': True
-        })
-    
-    try:
-        data = request.json
-        
-        # Create feature vector
-        features = []
-        for feature in login_features:
-            if feature in data:
-                features.append(data[feature])
-            else:
-                features.append(0)  # Default value
-        
-        # Convert to numpy array and reshape
-        features_array = np.array(features).reshape(1, -1)
-        
-        # Scale features
-        features_scaled = login_scaler.transform(features_array)
-        
-        # Make prediction
-        prediction = login_model.predict(features_scaled)[0]
-        probability = login_model.predict_proba(features_scaled)[0]
-        
-        # Calculate actual response time
-        response_time = int((time.time() - start_time) * 1000)
-        
-        return jsonify({
-            'success': True,
-            'prediction': int(prediction),
-            'probability': float(probability[1] if prediction == 1 else probability[0]),
-            'model_performance': 0.8420,  # Default performance score
-            'model_type': 'RandomForest Classifier',
-            'response_time': f'{response_time}ms',
-            'timestamp': datetime.now().isoformat(),
-            'enhanced': True
-        })
-    
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 400
+    return predict_single('login', 'predict_login')
 
 @app.route('/api/predict/attack', methods=['POST'])
 @monitor_performance
-@rate_limit(max_requests=50, window=60)
+@rate_limit(**PREDICT_RATE_LIMIT)
 def predict_attack():
+    return predict_single('attack', 'predict_attack')
+
+@app.route('/api/logins', methods=['POST'])
+@monitor_performance
+@rate_limit(**BULK_RATE_LIMIT)
+def record_logins():
+    """Add real logins (a JSON record or array of records) to the feature store history"""
+    payload = request.get_json(silent=True)
+    records = [payload] if isinstance(payload, dict) else payload
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        return jsonify({'success': False, 'error': 'Body must be a JSON record or an array of records'}), 400
+    if len(records) > BULK_MAX_ROWS:
+        return jsonify({'success': False, 'error': f'Maximum {BULK_MAX_ROWS} rows per request'}), 413
+    feature_store.record(records)
+    return jsonify({'success': True, 'recorded': len(records)})
+
+@app.route('/api/predict/<model>/bulk', methods=['POST'])
+@monitor_performance
+@rate_limit(**BULK_RATE_LIMIT)  # Lower limit for bulk processing
+def predict_bulk(model):
     start_time = time.time()
-    if not ATTACK_MODEL_LOADED:
-        return jsonify({
-            'success': True,
-            'prediction': 0,
-            'probability': 0.92,
-            'model_performance': 0.9200,
-            'model_type': 'GradientBoosting',
-            'timestamp': datetime.now().isoformat(),
-            'demo': True
-        })
+    spec = resolve_model(model)
+    if spec is None:
+        return jsonify({'success': False, 'error': 'Invalid model'}), 400
     
     try:
-        data = request.json
-        
-        # Create feature vector
-        features = []
-        for feature in attack_features:
-            if feature in data:
-                features.append(data[feature])
-            else:
-                features.append(0)  # Default value
-        
-        # Convert to numpy array and reshape
-        features_array = np.array(features).reshape(1, -1)
-        
-        # Scale features
-        features_scaled = attack_scaler.transform(features_array)
+        stage_start = time.perf_counter()
+        payload = request.json
+        stage_start = record_stage('predict_bulk', 'parse', stage_start)
+        X = build_feature_matrix(payload, spec['features'])
+        stage_start = record_stage('predict_bulk', 'features', stage_start)
+        if X.shape[0] > BULK_MAX_ROWS:
+            return jsonify({
+                'success': False,
+                'error': f'Maximum {BULK_MAX_ROWS} rows per request'
+            }), 413
         
-        # Make prediction
-        prediction = attack_model.predict(features_scaled)[0]
-        probability = attack_model.predict_proba(features_scaled)[0]
+        result = bulk_prediction_payload(model, spec, X, start_time)
+        stage_start = record_stage('predict_bulk', 'predict', stage_start)
         
-        # Calculate actual response time
-        response_time = int((time.time() - start_time) * 1000)
-        
-        return jsonify({
-            'success': True,
-            'prediction': int(prediction),
-            'probability': float(probability[1] if prediction == 1 else probability[0]),
-            'model_performance': 0.9200,  # Default performance score
-            'model_type': 'GradientBoosting',
-            'response_time': f'{response_time}ms',
-            'timestamp': datetime.now().isoformat(),
-            'enhanced': True
-        })
+        response = jsonify(result)
+        record_stage('predict_bulk', 'serialize', stage_start)
+        return response
     
     except Exception as e:
         return jsonify({
@@ -321,66 +517,30 @@ def predict_attack():
 @cache.cached(timeout=60)  # Cache for 1 minute
 def get_models_info():
     models_info = {}
+    versions = model_registry.versions()
+    display_names = {
+        'rtt': 'Round-Trip Time Prediction',
+        'login': 'Login Success Prediction',
+        'attack': 'Attack Detection'
+    }
     
-    # RTT Model Info
-    if RTT_MODEL_LOADED:
-        models_info['rtt_model'] = {
-            'name': 'Round-Trip Time Prediction',
-            'type': 'RandomForest Regressor',
-            'performance': 0.9989,
-            'features': rtt_features,
-            'created_at': '2024-01-01T00:00:00',
-            'enhanced': True
-        }
-    else:
-        models_info['rtt_model'] = {
-            'name': 'Round-Trip Time Prediction (Demo)',
-            'type': 'RandomForest Regressor',
-            'performance': 0.9989,
-            'features': rtt_features,
+    for model, bundle_name in MODEL_BUNDLES.items():
+        features = model_registry.features(bundle_name)
+        status = versions.get(bundle_name, {})
+        model_data = {
+            'name': display_names[model],
+            'type': MODEL_TYPES[model],
+            'performance': MODEL_PERFORMANCE[model],
+            'features': features if features is not None else dummy_features,
             'created_at': '2024-01-01T00:00:00',
-            'demo': True
-        }
-    
-    # Login Model Info
-    if LOGIN_MODEL_LOADED:
-        models_info['login_model'] = {
-            'name': 'Login Success Prediction',
-            'type': 'RandomForest Classifier',
-            'performance': 0.8420,
-            'features': login_features,
-            'created_at': '2024-01-01T00:00:00',
-            'enhanced': True
-        }
-    else:
-        models_info['login_model'] = {
-            'name': 'Login Success Prediction (Demo)',
-            'type': 'RandomForest Classifier',
-            'performance': 0.8420,
-            'features': login_features,
-            'created_at': '2024-01-01T00:00:00',
-            'demo': True
-        }
-    
-    # Attack Model Info
-    if ATTACK_MODEL_LOADED:
-        models_info['attack_model'] = {
-            'name': 'Attack Detection',
-            'type': 'GradientBoosting',
-            'performance': 0.9200,
-            'features': attack_features,
-            'created_at': '2024-01-01T00:00:00',
-            'enhanced': True
-        }
-    else:
-        models_info['attack_model'] = {
-            'name': 'Attack Detection (Demo)',
-            'type': 'GradientBoosting',
-            'performance': 0.9200,
-            'features': attack_features,
-            'created_at': '2024-01-01T00:00:00',
-            'demo': True
+            'version': status.get('version')
         }
+        if features is not None:
+            model_data['enhanced'] = True
+        else:
+            model_data['name'] += ' (Demo)'
+            model_data['demo'] = True
+        models_info[f'{model}_model'] = model_data
     
     # Convert to the format expected by frontend
     models_list = []
@@ -396,101 +556,241 @@ def get_models_info():
             'features': len(model_data['features']) if model_data['features'] else 'N/A',
             'loaded': not model_data.get('demo', False),
             'enhanced': model_data.get('enhanced', False),
-            'created_at': model_data['created_at']
+            'created_at': model_data['created_at'],
+            'version': model_data['version']
         })
     
     return jsonify({'models': models_list})
 
+@app.route('/api/models/versions')
+@monitor_performance
+def get_models_versions():
+    return jsonify({
+        'bundles': MODEL_BUNDLES,
+        'versions': model_registry.versions()
+    })
+
+@app.route('/api/models/cache')
+@monitor_performance
+def get_cache_stats():
+    stats = {}
+    for model, bundle_name in MODEL_BUNDLES.items():
+        if model_registry.is_loaded(bundle_name):
+            bundle = get_bundle(model)
+            stats[model] = dict(bundle.cache.stats(), version=bundle.version)
+    return jsonify({'cache': stats})
+
+def loaded_model_gauge(read):
+    """Gauge callback reading one value from every loaded model at scrape time"""
+    return lambda: {
+        (('model', name),): read(bundle) for name, bundle in model_registry.loaded().items()
+    }
+
+metrics.gauge('micro_batch_queue_depth', loaded_model_gauge(lambda bundle: bundle.batcher.queue_depth))
+metrics.gauge('prediction_cache_hits', loaded_model_gauge(lambda bundle: bundle.cache.hits))
+metrics.gauge('prediction_cache_misses', loaded_model_gauge(lambda bundle: bundle.cache.misses))
+metrics.gauge('feature_store_keys', lambda: {(): len(feature_store)})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return app.response_class(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+# Readiness: every configured model is loaded and warmed once per process before
+# /healthz/ready passes, so load balancers keep cold instances out of rotation
+warmup_state = {'status': 'pending', 'seconds': None, 'cold_start_seconds': None, 'models': {}}
+warmup_lock = threading.Lock()
+
+def run_warmup():
+    start = time.perf_counter()
+    models = {}
+    for model in MODEL_BUNDLES:
+        try:
+            bundle = get_bundle(model)
+            if bundle is None:
+                error = model_registry.versions().get(MODEL_BUNDLES[model], {}).get('error')
+                models[model] = {'status': 'failed', 'error': error} if error else {'status': 'missing'}
+            else:
+                # Warm-up runs on the registry's thread; wait here, not in the requests
+                bundle.warmed.wait()
+                warmup = bundle.warmup or {}
+                status = 'failed' if 'error' in warmup else 'warm'
+                models[model] = {'status': status, 'version': bundle.version, **warmup}
+        except Exception as e:
+            models[model] = {'status': 'failed', 'error': str(e)}
+    
+    failed = any(info['status'] == 'failed' for info in models.values())
+    warmup_state.update(models=models, seconds=round(time.perf_counter() - start, 3),
+                        status='failed' if failed else 'ready')
+    if warmup_state['cold_start_seconds'] is None and not failed:
+        warmup_state['cold_start_seconds'] = round(time.perf_counter() - BOOT_STARTED, 3)
+    print(f"🔥 Warm-up {warmup_state['status']} in {warmup_state['seconds']:.2f}s"
+          f" (cold start {warmup_state['cold_start_seconds'] or 0:.2f}s)")
+    for model, info in models.items():
+        print(f"  {model}: {info}")
+
+def start_warmup():
+    """Start the warm-up in the background, once per process (again if it failed)"""
+    with warmup_lock:
+        if warmup_state.get('pid') == os.getpid() and warmup_state['status'] != 'failed':
+            return
+        warmup_state.update(status='warming', pid=os.getpid())
+    threading.Thread(target=run_warmup, name='warmup', daemon=True).start()
+
+@app.route('/healthz/ready')
+def readiness():
+    start_warmup()
+    # Started per worker process, not at import: a preloading parent must not run jobs
+    job_manager.start()
+    ready = warmup_state['status'] == 'ready'
+    payload = {key: value for key, value in warmup_state.items() if key != 'pid'}
+    return jsonify({'ready': ready, **payload}), 200 if ready else 503
+
+def upload_format(filename):
+    """Format of this request's upload: from the file name, or ?format= / Content-Type for a raw body"""
+    if filename is not None:
+        fmt = detect_format(filename)
+    else:
+        fmt = request.args.get('format') or format_for_mimetype(request.mimetype)
+    return fmt if fmt in MIMETYPES else None
+
 @app.route('/api/batch_predict/<model>', methods=['POST'])
 @monitor_performance
-@rate_limit(max_requests=10, window=60)  # Lower limit for batch processing
+@rate_limit(**BULK_RATE_LIMIT)  # Lower limit for batch processing
 def batch_predict(model):
-    if 'file' not in request.files:
-        return jsonify({'success': False, 'error': 'No file uploaded'}), 400
-    file = request.files['file']
-    if not file.filename.endswith('.csv'):
-        return jsonify({'success': False, 'error': 'Only CSV files are supported'}), 400
+    # Chunk size and scoring threads, overridable per request up to the configured maximums
+    chunk_size = min(request.args.get('chunk_size', BATCH_CHUNK_SIZE, type=int), BATCH_MAX_CHUNK_SIZE)
+    workers = min(request.args.get('workers', BATCH_WORKERS, type=int), BATCH_MAX_WORKERS)
+    if chunk_size < 1 or workers < 1:
+        return jsonify({'success': False, 'error': 'chunk_size and workers must be positive'}), 400
+    
+    # Choose features and model
+    spec = resolve_model(model)
+    if spec is None:
+        return jsonify({'success': False, 'error': 'Invalid model'}), 400
+    features = spec['features']
+    header_cols = spec['columns']
+    
     try:
-        # Optimized batch processing with streaming for large files
-        chunk_size = 1000  # Process in chunks for memory efficiency
+        # The upload is parsed straight off the request body rather than saved by
+        # Werkzeug first: multipart with a 'file' field, or the raw file as the body
+        source, filename = open_upload(request)
+        input_format = upload_format(filename)
+        if input_format is None:
+            return jsonify({'success': False, 'error': 'Supported formats: CSV, Parquet, Arrow IPC, Feather'}), 400
+        # Results come back in the upload's format unless another one is requested
+        output_format = request.args.get('output', input_format)
+        if output_format not in MIMETYPES:
+            return jsonify({'success': False, 'error': f'Unknown output format: {output_format}'}), 400
         
-        # Choose features and model
-        if model == 'rtt':
-            features = rtt_features
-            scaler = rtt_scaler if RTT_MODEL_LOADED else None
-            mdl = rtt_model if RTT_MODEL_LOADED else None
-        elif model == 'login':
-            features = login_features
-            scaler = login_scaler if LOGIN_MODEL_LOADED else None
-            mdl = login_model if LOGIN_MODEL_LOADED else None
-        elif model == 'attack':
-            features = attack_features
-            scaler = attack_scaler if ATTACK_MODEL_LOADED else None
-            mdl = attack_model if ATTACK_MODEL_LOADED else None
-        else:
-            return jsonify({'success': False, 'error': 'Invalid model'}), 400
+        if input_format in SEEKABLE_FORMATS:
+            source = spool(source, BATCH_SPOOL_MAX_MEMORY)
+        
+        # Columnar files carry their schema, so missing features are rejected before streaming
+        columns = column_names(source, input_format)
+        if columns is not None:
+            missing = [name for name in features if name not in columns]
+            if missing:
+                return jsonify({'success': False, 'error': f'Missing feature columns: {missing}'}), 400
+        
+        def score_and_serialize(chunk):
+            stage_start = time.perf_counter()
+            scored = score_chunk(chunk, spec, model)
+            stage_start = record_stage('batch_predict', 'predict', stage_start)
+            if output_format == 'csv':
+                encoded = scored.to_csv(index=False, header=False)
+            else:
+                encoded = to_table(scored)
+            record_stage('batch_predict', 'serialize', stage_start)
+            return encoded
+        
+        # Read only the feature columns in chunks, score and serialize them on
+        # worker threads, and stream them back in input order
+        upload_read = threading.Event()
+        
+        def read_chunks():
+            yield from iter_frames(source, input_format, features, chunk_size)
+            upload_read.set()
         
-        # Stream processing for large files
         def generate_results():
-            # Write header
-            header_cols = features + ['prediction']
-            if model != 'rtt':
-                header_cols.append('probability')
-            yield f"{','.join(header_cols)}\n"
+            scored = ordered_parallel_map(score_and_serialize, read_chunks(), workers)
+            if output_format == 'csv':
+                yield f"{','.join(header_cols)}\n"
+                yield from scored
+                return
             
-            # Process in chunks
-            for chunk in pd.read_csv(file, chunksize=chunk_size):
-                # Prepare feature matrix for chunk
-                X = chunk[features].fillna(0).values
-                
-                if (model == 'rtt' and RTT_MODEL_LOADED) or (model == 'login' and LOGIN_MODEL_LOADED) or (model == 'attack' and ATTACK_MODEL_LOADED):
-                    X_scaled = scaler.transform(X)
-                    preds = mdl.predict(X_scaled)
-                    
-                    if hasattr(mdl, 'predict_proba'):
-                        proba = mdl.predict_proba(X_scaled)[:, 1]
-                        # Yield results for this chunk
-                        for i, (pred, prob) in enumerate(zip(preds, proba)):
-                            row_data = [str(chunk[feature].iloc[i]) for feature in features]
-                            row_data.extend([str(pred), str(prob)])
-                            yield f"{','.join(row_data)}\n"
-                    else:
-                        # Yield results for this chunk
-                        for i, pred in enumerate(preds):
-                            row_data = [str(chunk[feature].iloc[i]) for feature in features]
-                            row_data.append(str(pred))
-                            yield f"{','.join(row_data)}\n"
-                else:
-                    # Demo mode: random/fixed predictions
-                    import numpy as np
-                    preds = np.random.randint(0, 2, size=len(chunk)) if model != 'rtt' else np.random.uniform(10, 100, size=len(chunk))
-                    if model != 'rtt':
-                        proba = np.random.uniform(0.7, 0.99, size=len(chunk))
-                        # Yield results for this chunk
-                        for i, (pred, prob) in enumerate(zip(preds, proba)):
-                            row_data = [str(chunk[feature].iloc[i]) for feature in features]
-                            row_data.extend([str(pred), str(prob)])
-                            yield f"{','.join(row_data)}\n"
-                    else:
-                        # Yield results for this chunk
-                        for i, pred in enumerate(preds):
-                            row_data = [str(chunk[feature].iloc[i]) for feature in features]
-                            row_data.append(str(pred))
-                            yield f"{','.join(row_data)}\n"
+            writer = ColumnarWriter(output_format)
+            for table in scored:
+                yield writer.write(table)
+            yield writer.close(empty_columns=header_cols)
+        
+        results = generate_results()
+        # Scoring starts as soon as the first chunk arrives. Unless the client reads
+        # while it sends (?duplex=1), results are sent once the upload has been read
+        if input_format not in SEEKABLE_FORMATS and not request.args.get('duplex', type=int):
+            results = hold_until(results, upload_read.is_set, BATCH_SPOOL_MAX_MEMORY)
         
         return app.response_class(
-            generate_results(),
-            mimetype='text/csv',
-            headers={'Content-Disposition': f'attachment; filename={model}_predictions.csv'}
+            stream_with_context(results),
+            mimetype=MIMETYPES[output_format],
+            headers={'Content-Disposition': f'attachment; filename={model}_predictions.{output_format}'}
         )
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/jobs/<model>', methods=['POST'])
+@monitor_performance
+@rate_limit(**BULK_RATE_LIMIT)
+def create_job(model):
+    if resolve_model(model) is None:
+        return jsonify({'success': False, 'error': 'Invalid model'}), 400
+    chunk_size = min(request.args.get('chunk_size', JOB_CHUNK_SIZE, type=int), BATCH_MAX_CHUNK_SIZE)
+    if chunk_size < 1:
+        return jsonify({'success': False, 'error': 'chunk_size must be positive'}), 400
+    
+    try:
+        source, filename = open_upload(request)
+        input_format = upload_format(filename)
+        if input_format is None:
+            return jsonify({'success': False, 'error': 'Supported formats: CSV, Parquet, Arrow IPC, Feather'}), 400
+        job = job_manager.create(model, source, input_format, chunk_size)
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
+    
+    return jsonify({'success': True, 'job': job}), 202, {'Location': f"/api/jobs/{job['id']}"}
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/jobs/<job_id>/result')
+def get_job_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    if job['status'] != 'done':
+        return jsonify({'success': False, 'error': f"Job is {job['status']}", 'job': job}), 409
+    return send_file(
+        job_manager.result_path(job_id),
+        mimetype='application/gzip',
+        as_attachment=True,
+        download_name=f"{job['model']}_predictions.csv.gz"
+    )
 
 if __name__ == '__main__':
     print("🚀 Starting God Tier AI Dashboard...")
+    print(f"⏱️ Imports and setup took {time.perf_counter() - BOOT_STARTED:.2f}s")
     print("📍 Server will be available at: http://localhost:8080")
-    print("🎯 Models loaded:")
-    print(f"  RTT: {'✅ Yes' if RTT_MODEL_LOADED else '❌ No'}")
-    print(f"  Login: {'✅ Yes' if LOGIN_MODEL_LOADED else '❌ No'}")
-    print(f"  Attack: {'✅ Yes' if ATTACK_MODEL_LOADED else '❌ No'}")
+    print("🎯 Models available (loaded on first use):")
+    available = model_registry.discover()
+    for model, bundle_name in MODEL_BUNDLES.items():
+        print(f"  {model}: {'✅ ' + bundle_name if bundle_name in available else '❌ No'}")
+    start_warmup()
+    job_manager.start()
     app.run(debug=True, host='0.0.0.0', port=8080) 
\ No newline at end of file
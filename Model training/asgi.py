@@ -0,0 +1,243 @@
+# ASGI entry point for the dashboard API
+# Serves the prediction routes natively (parsing and scoring run on bounded
+# thread pools and the micro-batcher) and hands every other route to the
+# Flask app. Run with:
+#   uvicorn asgi:application --host 0.0.0.0 --port 8080
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+import app as dashboard
+from request_schema import SchemaError
+
+# Backpressure: rows allowed to wait in a model's micro-batch queue before we shed load
+ASGI_MAX_QUEUED_ROWS = int(os.environ.get('ASGI_MAX_QUEUED_ROWS', 512))
+# Threads that parse single predictions and build their rows, and how many more may wait for one
+ASGI_ROW_WORKERS = int(os.environ.get('ASGI_ROW_WORKERS', 8))
+ASGI_ROW_MAX_PENDING = int(os.environ.get('ASGI_ROW_MAX_PENDING', 256))
+# Bulk requests scored at once, and how many more may wait for a worker
+ASGI_BULK_WORKERS = int(os.environ.get('ASGI_BULK_WORKERS', 2))
+ASGI_BULK_MAX_PENDING = int(os.environ.get('ASGI_BULK_MAX_PENDING', 8))
+# Largest request body read into memory
+ASGI_MAX_BODY_BYTES = int(os.environ.get('ASGI_MAX_BODY_BYTES', 64 * 1024 * 1024))
+
+row_executor = ThreadPoolExecutor(ASGI_ROW_WORKERS, thread_name_prefix='asgi-row')
+row_pending = 0
+bulk_executor = ThreadPoolExecutor(ASGI_BULK_WORKERS, thread_name_prefix='asgi-bulk')
+bulk_pending = 0
+
+# Everything else (dashboard page, model info, batch CSV upload, /metrics) stays on Flask
+flask_application = WsgiToAsgi(dashboard.app)
+
+OVERLOADED = {'success': False, 'error': 'Server busy, retry shortly'}
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+async def read_body(receive):
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionError('Client disconnected')
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > ASGI_MAX_BODY_BYTES:
+            raise RequestTooLarge()
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode())] + list(headers),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def query_flag(scope, name):
+    """True if the query string sets name to a non-zero integer, like request.args.get(name, type=int)"""
+    value = parse_qs(scope.get('query_string', b'').decode()).get(name, ['0'])[0]
+    try:
+        return bool(int(value))
+    except ValueError:
+        return False
+
+
+def client_ip(scope):
+    client = scope.get('client')
+    return client[0] if client else None
+
+
+async def check_rate_limit(send, route, scope, limit):
+    """Send a 429 and return False if the client is over its limit"""
+    retry_after = dashboard.consume_rate_limit(f'{route}:{client_ip(scope)}', **limit)
+    if retry_after is None:
+        return True
+    await send_json(send, 429, dashboard.rate_limit_payload(**limit),
+                    [(b'retry-after', str(retry_after).encode())])
+    return False
+
+
+def build_row(model, route, body):
+    """Bundle lookup, parsing and feature building for a single prediction, run off the event loop.
+
+    Loading or reloading a model and syncing the feature store both block.
+    Returns (None, None, None) in demo mode.
+    """
+    bundle = dashboard.get_bundle(model)
+    if bundle is None:
+        return None, None, None
+    stage_start = time.perf_counter()
+    data = bundle.schema.decode(body)
+    stage_start = dashboard.record_stage(route, 'parse', stage_start)
+
+    features_array = bundle.schema.row(data)
+    dashboard.feature_store.fill(features_array, data, bundle.store_columns)
+    dashboard.record_stage(route, 'features', stage_start)
+    return bundle, data, features_array
+
+
+async def predict_single(scope, receive, send, model):
+    global row_pending
+    route = f'predict_{model}'
+    start_time = time.time()
+    if not await check_rate_limit(send, route, scope, dashboard.PREDICT_RATE_LIMIT):
+        return
+
+    loop = asyncio.get_running_loop()
+    try:
+        body = await read_body(receive)
+        # Shed load before queueing, like the micro-batch check below
+        if row_pending >= ASGI_ROW_WORKERS + ASGI_ROW_MAX_PENDING:
+            await send_json(send, 503, OVERLOADED, [(b'retry-after', b'1')])
+            return
+        row_pending += 1
+        try:
+            bundle, data, features_array = await loop.run_in_executor(row_executor, build_row, model, route, body)
+        finally:
+            row_pending -= 1
+        if bundle is None:
+            await send_json(send, 200, dashboard.demo_payload(model))
+            return
+        stage_start = time.perf_counter()
+
+        key = bundle.cache.key(features_array) if bundle.cache.enabled else None
+        result = bundle.cache.get(key) if key is not None else None
+        if result is None:
+            if bundle.batcher.queue_depth >= ASGI_MAX_QUEUED_ROWS:
+                await send_json(send, 503, OVERLOADED, [(b'retry-after', b'1')])
+                return
+            # The micro-batcher thread runs the model; we just await its future
+            result = await asyncio.wrap_future(bundle.batcher.submit(features_array))
+            if key is not None:
+                bundle.cache.put(key, result)
+        stage_start = dashboard.record_stage(route, 'predict', stage_start)
+
+        # Recording appends to the login journal, so it happens off the event loop
+        if query_flag(scope, 'record'):
+            await loop.run_in_executor(None, dashboard.feature_store.record, [data])
+
+        prediction, probability = result
+        await send_json(send, 200, dashboard.prediction_payload(model, prediction, probability, start_time))
+        dashboard.record_stage(route, 'serialize', stage_start)
+
+    except RequestTooLarge:
+        await send_json(send, 413, {'success': False, 'error': 'Request body too large'})
+    except SchemaError as e:
+        await send_json(send, 422, e.payload())
+    except Exception as e:
+        await send_json(send, 500, {'success': False, 'error': str(e)})
+
+
+def score_bulk(model, spec, body, start_time):
+    """Parsing, feature building and scoring for a bulk request, run on the bulk executor"""
+    X = dashboard.build_feature_matrix(json.loads(body), spec['features'])
+    if X.shape[0] > dashboard.BULK_MAX_ROWS:
+        return 413, {'success': False, 'error': f'Maximum {dashboard.BULK_MAX_ROWS} rows per request'}
+    return 200, dashboard.bulk_prediction_payload(model, spec, X, start_time)
+
+
+async def predict_bulk(scope, receive, send, model):
+    global bulk_pending
+    start_time = time.time()
+    if not await check_rate_limit(send, 'predict_bulk', scope, dashboard.BULK_RATE_LIMIT):
+        return
+
+    # resolve_model loads the bundle on first use, which blocks
+    loop = asyncio.get_running_loop()
+    spec = await loop.run_in_executor(None, dashboard.resolve_model, model)
+    if spec is None:
+        await send_json(send, 400, {'success': False, 'error': 'Invalid model'})
+        return
+
+    if bulk_pending >= ASGI_BULK_WORKERS + ASGI_BULK_MAX_PENDING:
+        await send_json(send, 503, OVERLOADED, [(b'retry-after', b'1')])
+        return
+
+    bulk_pending += 1
+    try:
+        body = await read_body(receive)
+        status, result = await loop.run_in_executor(bulk_executor, score_bulk, model, spec, body, start_time)
+        await send_json(send, status, result)
+    except RequestTooLarge:
+        await send_json(send, 413, {'success': False, 'error': 'Request body too large'})
+    except Exception as e:
+        await send_json(send, 400, {'success': False, 'error': str(e)})
+    finally:
+        bulk_pending -= 1
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            dashboard.start_warmup()
+            dashboard.job_manager.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            row_executor.shutdown(wait=False)
+            bulk_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+
+    if scope['type'] == 'http' and scope['method'] == 'POST':
+        parts = scope['path'].strip('/').split('/')
+        # /api/predict/<model> and /api/predict/<model>/bulk
+        if parts[:2] == ['api', 'predict'] and len(parts) in (3, 4):
+            model = parts[2]
+            start = time.perf_counter()
+            if len(parts) == 3 and model in dashboard.MODEL_BUNDLES:
+                await predict_single(scope, receive, send, model)
+                route = f'predict_{model}'
+            elif len(parts) == 4 and parts[3] == 'bulk':
+                await predict_bulk(scope, receive, send, model)
+                route = 'predict_bulk'
+            else:
+                route = None
+            if route is not None:
+                dashboard.metrics.observe('request_duration_seconds', (('route', route),),
+                                          time.perf_counter() - start)
+                return
+
+    await flask_application(scope, receive, send)
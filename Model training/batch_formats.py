@@ -0,0 +1,179 @@
+# File formats for /api/batch_predict uploads and results
+# CSV is parsed in chunks; Parquet, Arrow IPC and Feather files are read with
+# column projection, one row group / record batch at a time, and predictions
+# can be written back in a columnar format as each chunk is scored.
+# pandas and pyarrow are imported on first use, so processes that only serve
+# single predictions never load them
+
+import io
+import os
+
+# Upload extension -> format name
+FORMATS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.arrow': 'arrow',
+    '.ipc': 'arrow',
+    '.arrows': 'arrows',
+    '.feather': 'feather',
+}
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.file',
+    'arrows': 'application/vnd.apache.arrow.stream',
+    'feather': 'application/vnd.apache.arrow.file',
+}
+
+# Parquet and Arrow IPC file footers sit at the end, so these need a seekable copy;
+# CSV and Arrow IPC streams are parsed straight off the upload
+SEEKABLE_FORMATS = ('parquet', 'arrow', 'feather')
+
+
+def _arrow():
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+    return pa, feather, pq
+
+
+def detect_format(filename):
+    """Format name for an uploaded file, or None if unsupported"""
+    return FORMATS.get(os.path.splitext(filename or '')[1].lower())
+
+
+def format_for_mimetype(mimetype):
+    """Format name for a raw request body's Content-Type, or None if unsupported"""
+    for fmt, known in MIMETYPES.items():
+        if mimetype == known:
+            return fmt
+    return None
+
+
+def column_names(source, fmt):
+    """Columns of a columnar file read from its schema only, or None if that needs a full pass"""
+    pa, _, pq = _arrow()
+    if fmt == 'parquet':
+        names = pq.ParquetFile(source).schema_arrow.names
+    elif fmt in ('arrow', 'feather'):
+        try:
+            names = pa.ipc.open_file(source).schema.names
+        except pa.ArrowInvalid:
+            # Feather v1 is not an IPC file; its reader loads everything anyway
+            return None
+    else:
+        return None
+    source.seek(0)
+    return names
+
+
+def count_rows(path, fmt):
+    """Row count of a saved upload when its metadata has one, otherwise None"""
+    _, _, pq = _arrow()
+    if fmt == 'parquet':
+        return pq.ParquetFile(path).metadata.num_rows
+    return None
+
+
+def iter_frames(source, fmt, columns, chunk_size):
+    """Yield DataFrames of at most chunk_size rows holding only the given columns"""
+    pa, feather, pq = _arrow()
+    if fmt == 'csv':
+        import pandas as pd
+        wanted = set(columns)
+        try:
+            reader = pd.read_csv(source, chunksize=chunk_size, usecols=lambda name: name in wanted)
+        except pd.errors.EmptyDataError:
+            # A zero-byte upload has no rows to score
+            return
+        yield from reader
+        return
+
+    if fmt == 'parquet':
+        # Reads only the projected column chunks of one row group at a time
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    if fmt == 'arrows':
+        batches = pa.ipc.open_stream(source)
+    else:
+        try:
+            reader = pa.ipc.open_file(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            source.seek(0)
+            batches = feather.read_table(source, columns=columns).to_batches()
+
+    for batch in batches:
+        batch = batch.select(columns)
+        for offset in range(0, batch.num_rows, chunk_size):
+            yield batch.slice(offset, chunk_size).to_pandas()
+
+
+def to_table(frame):
+    pa = _arrow()[0]
+    return pa.Table.from_pandas(frame, preserve_index=False)
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only buffer whose contents can be taken out between writes"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+class ColumnarWriter:
+    """Streams tables out as Parquet or Arrow IPC, returning the bytes produced by each write"""
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self._sink = _DrainableSink()
+        self._writer = None
+        self._schema = None
+
+    def _open(self, schema):
+        pa, _, pq = _arrow()
+        self._schema = schema
+        if self.fmt == 'parquet':
+            self._writer = pq.ParquetWriter(self._sink, schema)
+        elif self.fmt == 'arrows':
+            self._writer = pa.ipc.new_stream(self._sink, schema)
+        else:
+            # Feather v2 is the Arrow IPC file format
+            self._writer = pa.ipc.new_file(self._sink, schema)
+
+    def write(self, table):
+        if self._writer is None:
+            self._open(table.schema)
+        elif table.schema != self._schema:
+            table = table.cast(self._schema)
+        self._writer.write_table(table)
+        return self._sink.drain()
+
+    def close(self, empty_columns=()):
+        if self._writer is None:
+            # Nothing was written: still produce a valid, empty file
+            pa = _arrow()[0]
+            self._open(pa.schema([(name, pa.float64()) for name in empty_columns]))
+        self._writer.close()
+        return self._sink.drain()
@@ -0,0 +1,285 @@
+# Background batch-scoring jobs
+# An upload is saved under JOB_DIR/<id>/, scored chunk by chunk on a local
+# worker pool and appended to a gzip spool. Progress is checkpointed after
+# every chunk, so a restarted server resumes from the last completed one.
+# The model version and feature list are recorded with the job: a run scores
+# every chunk with one model, and a resumed job whose model has changed since
+# starts over rather than mixing two models in one result file.
+
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from batch_formats import count_rows, iter_frames
+
+try:
+    import fcntl
+except ImportError:  # Windows: one server process, nothing to claim jobs from
+    fcntl = None
+
+JOB_FILE = 'job.json'
+RESULT_FILE = 'result.csv.gz'
+LOCK_FILE = 'lock'
+# Held for its lifetime by the one process that resumes unfinished jobs
+RESUME_LOCK_FILE = '.resume.lock'
+
+UNFINISHED = ('queued', 'running')
+
+
+def write_json(path, data):
+    """Write to a temp file and rename it into place so readers never see half a file"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def valid_job_id(job_id):
+    return len(job_id) == 32 and all(c in '0123456789abcdef' for c in job_id)
+
+
+class JobManager:
+    """Creates, runs, resumes and reports on batch-scoring jobs"""
+
+    def __init__(self, job_dir, resolve, score_chunk, workers=1, chunk_size=50000, retention=7 * 24 * 3600,
+                 rescan_interval=60):
+        self.job_dir = job_dir
+        # resolve(model) -> spec with 'features', 'version' and result 'columns' of the model loaded now,
+        # score_chunk(model, spec, frame) -> scored DataFrame
+        self.resolve = resolve
+        self.score_chunk = score_chunk
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.retention = retention
+        # Seconds between scans for unfinished jobs nobody is running (a worker died mid-job)
+        self.rescan_interval = rescan_interval
+        self._executor = None
+        self._pid = None
+        self._resume_lock = None
+        # Jobs submitted to this process's pool and not finished yet
+        self._active = set()
+        self._lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # Only reset state here: the child starts its own pool on first use, and
+        # jobs are resumed by whichever process claims the resume lock
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._active = set()
+        if self._resume_lock is not None:
+            self._resume_lock.close()
+            self._resume_lock = None
+
+    def _dir(self, job_id):
+        return os.path.join(self.job_dir, job_id)
+
+    def _pool(self):
+        # Created on first use in each process, like the micro-batcher threads
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='batch-job')
+                self._pid = os.getpid()
+            if self._resume_lock is None and self._claim_resume():
+                self._resume()
+                if self.rescan_interval:
+                    threading.Thread(target=self._rescan, name='batch-job-rescan', daemon=True).start()
+            return self._executor
+
+    def _claim_resume(self):
+        """Make this the process that resumes jobs, False if another process already is"""
+        os.makedirs(self.job_dir, exist_ok=True)
+        lock = open(os.path.join(self.job_dir, RESUME_LOCK_FILE), 'w')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                return False
+        # Kept open: the lock is released when this process exits, and the next caller takes over
+        self._resume_lock = lock
+        return True
+
+    def start(self):
+        """Start this process's worker pool; one process also picks up jobs left unfinished by a previous run.
+
+        Cheap to call again: a process that is not resuming jobs retries the claim.
+        """
+        self._pool()
+
+    def _submit(self, job_id):
+        """Queue a job on this process's pool unless it is already queued or running here"""
+        if job_id in self._active:
+            return
+        self._active.add(job_id)
+
+        def run():
+            try:
+                self._run(job_id)
+            finally:
+                self._active.discard(job_id)
+
+        self._executor.submit(run)
+
+    def _rescan(self):
+        # Runs in the process holding the resume lock; _run's per-job lock skips jobs another process is running
+        while True:
+            time.sleep(self.rescan_interval)
+            with self._lock:
+                if self._resume_lock is None or self._pid != os.getpid():
+                    return
+                self._resume()
+
+    def _resume(self):
+        if not os.path.isdir(self.job_dir):
+            return
+        now = time.time()
+        for job_id in os.listdir(self.job_dir):
+            job = self.get(job_id)
+            if job is None:
+                continue
+            if job['status'] in UNFINISHED:
+                self._submit(job_id)
+            elif now - job['updated_at'] > self.retention:
+                shutil.rmtree(self._dir(job_id), ignore_errors=True)
+
+    def create(self, model, source, input_format, chunk_size=None):
+        """Save the upload and queue it, returns the job record"""
+        job_id = uuid.uuid4().hex
+        job_dir = self._dir(job_id)
+        input_path = os.path.join(job_dir, f'input.{input_format}')
+        os.makedirs(job_dir)
+        try:
+            with open(input_path, 'wb') as f:
+                shutil.copyfileobj(source, f, 1024 * 1024)
+        except Exception:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+
+        spec = self.resolve(model)
+        now = time.time()
+        job = {
+            'id': job_id,
+            'model': model,
+            'model_version': spec['version'],
+            'features': spec['features'],
+            'status': 'queued',
+            'input_format': input_format,
+            'chunk_size': chunk_size or self.chunk_size,
+            'chunks_done': 0,
+            'rows_done': 0,
+            'restarts': 0,
+            'total_rows': count_rows(input_path, input_format),
+            'result_bytes': 0,
+            'error': None,
+            'created_at': now,
+            'started_at': None,
+            'finished_at': None,
+            'updated_at': now,
+        }
+        write_json(os.path.join(job_dir, JOB_FILE), job)
+        self._pool()
+        with self._lock:
+            self._submit(job_id)
+        return job
+
+    def get(self, job_id):
+        if not valid_job_id(job_id):
+            return None
+        try:
+            with open(os.path.join(self._dir(job_id), JOB_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def result_path(self, job_id):
+        return os.path.join(self._dir(job_id), RESULT_FILE)
+
+    def _save(self, job):
+        job['updated_at'] = time.time()
+        write_json(os.path.join(self._dir(job['id']), JOB_FILE), job)
+
+    def _claim(self, job_id):
+        """Lock a job for this process, returns the open lock file or None if another process has it"""
+        lock = open(os.path.join(self._dir(job_id), LOCK_FILE), 'w')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                return None
+        return lock
+
+    def _run(self, job_id):
+        lock = self._claim(job_id)
+        if lock is None:
+            return
+        try:
+            job = self.get(job_id)
+            if job is None or job['status'] not in UNFINISHED:
+                return
+            job['status'] = 'running'
+            job['started_at'] = job['started_at'] or time.time()
+            self._save(job)
+            try:
+                self._score(job)
+                job['status'] = 'done'
+            except Exception as e:
+                job['status'] = 'failed'
+                job['error'] = str(e)
+            job['finished_at'] = time.time()
+            self._save(job)
+        finally:
+            lock.close()
+
+    def _pin_model(self, job):
+        """Model spec this run scores with; restarts the job if it was started with another model"""
+        spec = self.resolve(job['model'])
+        changed = job.get('model_version') != spec['version'] or job.get('features') != spec['features']
+        if changed and job['chunks_done']:
+            print(f"🔁 Job {job['id']}: model changed from version {job.get('model_version')} "
+                  f"to {spec['version']}, restarting from the first chunk")
+            job.update(chunks_done=0, rows_done=0, result_bytes=0, restarts=job.get('restarts', 0) + 1)
+        job['model_version'] = spec['version']
+        job['features'] = spec['features']
+        self._save(job)
+        return spec
+
+    def _score(self, job):
+        job_dir = self._dir(job['id'])
+        input_path = os.path.join(job_dir, f"input.{job['input_format']}")
+        # Resolved once, so a model reloaded mid-run does not change the remaining chunks
+        spec = self._pin_model(job)
+        with open(input_path, 'rb') as source, open(self.result_path(job['id']), 'ab') as spool:
+            # Drop anything written after the last checkpoint by a run that crashed
+            spool.truncate(job['result_bytes'])
+            spool.seek(job['result_bytes'])
+
+            chunks = iter_frames(source, job['input_format'], spec['features'], job['chunk_size'])
+            for index, chunk in enumerate(chunks):
+                if index < job['chunks_done']:
+                    continue
+                scored = self.score_chunk(job['model'], spec, chunk)
+                # Every chunk is its own gzip member; concatenated members are one valid .gz file
+                text = scored.to_csv(index=False, header=index == 0)
+                spool.write(gzip.compress(text.encode()))
+                spool.flush()
+                os.fsync(spool.fileno())
+
+                job['chunks_done'] = index + 1
+                job['rows_done'] += len(scored)
+                job['result_bytes'] = spool.tell()
+                self._save(job)
+
+            if not job['chunks_done']:
+                # No rows: a header-only CSV, still a valid .gz file
+                spool.write(gzip.compress(f"{','.join(spec['columns'])}\n".encode()))
+                job['result_bytes'] = spool.tell()
+                self._save(job)
@@ -0,0 +1,312 @@
+# Benchmark harness for the prediction endpoints
+# Starts the dashboard in this process (behind a real threaded WSGI server or
+# Flask's test client), replays synthetic login events at a fixed concurrency
+# against /api/predict/* and /api/batch_predict/*, and writes throughput,
+# latency percentiles and CPU/RSS for every scenario to a JSON file that later
+# runs can be compared against.
+#
+#   python benchmark.py --duration 10 --concurrency 1,8 --output bench.json
+#   python benchmark.py --baseline bench.json   # exits 1 on a regression
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+PREDICT_MODELS = ('rtt', 'login', 'attack')
+PERCENTILES = (50, 90, 95, 99)
+
+
+def synthetic_events(features, n_events, seed=0):
+    """Login events carrying every model feature plus the keys the feature store tracks"""
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(0, 10, size=(n_events, len(features)))
+    # A tenth as many users and IPs as events, so aggregates and the cache see repeats
+    users = rng.integers(0, max(1, n_events // 10), n_events)
+    ips = rng.integers(0, max(1, n_events // 10), n_events)
+    events = []
+    for i in range(n_events):
+        event = dict(zip(features, values[i].tolist()))
+        event['User ID'] = int(users[i])
+        event['IP Address'] = f'10.{ips[i] >> 16 & 255}.{ips[i] >> 8 & 255}.{ips[i] & 255}'
+        events.append(event)
+    return events
+
+
+def csv_upload(features, n_rows, seed=0):
+    """Multipart body holding one CSV file, and its Content-Type"""
+    rng = np.random.default_rng(seed)
+    lines = [','.join(f'"{name}"' if ',' in name else name for name in features)]
+    lines.extend(','.join(f'{value:.4f}' for value in row) for row in rng.uniform(0, 10, size=(n_rows, len(features))))
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="events.csv"\r\n'
+        f'Content-Type: text/csv\r\n\r\n'.encode()
+        + '\n'.join(lines).encode() + b'\n'
+        + f'\r\n--{boundary}--\r\n'.encode()
+    )
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class WSGIServerTarget:
+    """The app behind werkzeug's threaded server on a free local port"""
+
+    name = 'wsgi'
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+        self.thread = threading.Thread(target=self.server.serve_forever, name='benchmark-server', daemon=True)
+        self.thread.start()
+
+    def post(self, path, body, content_type):
+        request = urllib.request.Request(self.base_url + path, data=body, headers={'Content-Type': content_type})
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def close(self):
+        self.server.shutdown()
+
+
+class TestClientTarget:
+    """The app called through Flask's test client: no sockets, one client per thread"""
+
+    name = 'test-client'
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def post(self, path, body, content_type):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.post(path, data=body, content_type=content_type)
+        response.get_data()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+def cpu_seconds():
+    times = os.times()
+    return times.user + times.system
+
+
+def rss_mb():
+    """Current and peak resident set size of this process in MB (None where unavailable)"""
+    current = psutil.Process().memory_info().rss / 2 ** 20 if psutil is not None else None
+    peak = None
+    if resource is not None:
+        # ru_maxrss is in KB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+    return (round(current, 1) if current is not None else None,
+            round(peak, 1) if peak is not None else None)
+
+
+def run_scenario(target, path, bodies, content_type, concurrency, duration, max_requests=None, rows_per_request=1):
+    """Send requests from concurrency threads for duration seconds, returns the scenario report"""
+    counter = itertools.count()
+    stop_at = time.perf_counter() + duration
+
+    def worker():
+        latencies = []
+        statuses = Counter()
+        while time.perf_counter() < stop_at:
+            i = next(counter)
+            if max_requests is not None and i >= max_requests:
+                break
+            start = time.perf_counter()
+            try:
+                status = target.post(path, bodies[i % len(bodies)], content_type)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+        return latencies, statuses
+
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = [future.result() for future in [pool.submit(worker) for _ in range(concurrency)]]
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_start
+
+    latencies = np.array([latency for worker_latencies, _ in results for latency in worker_latencies]) * 1000
+    statuses = sum((worker_statuses for _, worker_statuses in results), Counter())
+    ok = sum(count for status, count in statuses.items() if isinstance(status, int) and status < 400)
+    rss, peak_rss = rss_mb()
+    report = {
+        'path': path,
+        'concurrency': concurrency,
+        'requests': int(latencies.size),
+        'errors': int(latencies.size - ok),
+        'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        'seconds': round(wall, 3),
+        'throughput_rps': round(latencies.size / wall, 2) if wall else 0.0,
+        'rows_per_second': round(ok * rows_per_request / wall, 2) if wall else 0.0,
+        'latency_ms': {},
+        'cpu_seconds': round(cpu, 3),
+        # Client and server share this process, so CPU covers both sides
+        'cpu_percent': round(100 * cpu / wall, 1) if wall else 0.0,
+        'rss_mb': rss,
+        'peak_rss_mb': peak_rss,
+    }
+    if latencies.size:
+        report['latency_ms'] = {
+            **{f'p{p}': round(float(value), 3) for p, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES))},
+            'mean': round(float(latencies.mean()), 3),
+            'max': round(float(latencies.max()), 3),
+        }
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Print each scenario against the baseline run, returns the names that regressed"""
+    regressions = []
+    for key in ('server', 'cpu_count'):
+        if baseline.get(key) != results[key]:
+            print(f"⚠️ Baseline {key} was {baseline.get(key)}, this run is {results[key]}: numbers may not be comparable")
+    previous = baseline.get('scenarios', {})
+    for name, report in results['scenarios'].items():
+        before = previous.get(name)
+        if before is None or not report['latency_ms'] or not before.get('latency_ms'):
+            print(f"  {name}: no baseline")
+            continue
+        throughput = report['throughput_rps'] / before['throughput_rps'] - 1 if before['throughput_rps'] else 0.0
+        p99 = report['latency_ms']['p99'] / before['latency_ms']['p99'] - 1 if before['latency_ms']['p99'] else 0.0
+        regressed = throughput < -tolerance or p99 > tolerance or report['errors'] > before['errors']
+        print(f"  {'❌' if regressed else '✅'} {name}: throughput {throughput:+.1%}, p99 {p99:+.1%}, "
+              f"errors {before['errors']} -> {report['errors']}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard prediction endpoints')
+    parser.add_argument('--server', choices=('wsgi', 'test-client'), default='wsgi',
+                        help='real threaded WSGI server on localhost, or the Flask test client')
+    parser.add_argument('--models', default=','.join(PREDICT_MODELS), help='models for /api/predict/<model>')
+    parser.add_argument('--batch-models', default='login', help='models for /api/batch_predict/<model> (empty to skip)')
+    parser.add_argument('--concurrency', default='1,8', help='client threads for the single-prediction scenarios')
+    parser.add_argument('--batch-concurrency', default='1,2', help='client threads for the batch scenarios')
+    parser.add_argument('--duration', type=float, default=5, help='seconds per scenario')
+    parser.add_argument('--requests', type=int, default=None, help='stop a scenario after this many requests')
+    parser.add_argument('--warmup-requests', type=int, default=20, help='untimed requests before each scenario')
+    parser.add_argument('--events', type=int, default=10000, help='distinct synthetic login events to replay')
+    parser.add_argument('--batch-rows', type=int, default=10000, help='rows per batch upload')
+    parser.add_argument('--keep-rate-limits', action='store_true', help='leave the per-client rate limits on')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default=None, help='earlier results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed throughput / p99 change before a regression')
+    return parser.parse_args(argv)
+
+
+def split(value):
+    return [item for item in value.split(',') if item]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # app.py loads models/ relative to the working directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    import app as dashboard
+    if not args.keep_rate_limits:
+        # One benchmark client would otherwise be throttled to a few requests per second
+        dashboard.consume_rate_limit = lambda key, max_requests, window: None
+    dashboard.run_warmup()
+    target = WSGIServerTarget(dashboard.app) if args.server == 'wsgi' else TestClientTarget(dashboard.app)
+
+    scenarios = []
+    for model in split(args.models):
+        features = dashboard.resolve_model(model)['features']
+        bodies = [json.dumps(event).encode() for event in synthetic_events(features, args.events, args.seed)]
+        for concurrency in map(int, split(args.concurrency)):
+            scenarios.append((f'predict/{model}@{concurrency}', f'/api/predict/{model}', bodies,
+                              'application/json', concurrency, 1))
+    for model in split(args.batch_models):
+        features = dashboard.resolve_model(model)['features']
+        body, content_type = csv_upload(features, args.batch_rows, args.seed)
+        for concurrency in map(int, split(args.batch_concurrency)):
+            scenarios.append((f'batch_predict/{model}@{concurrency}', f'/api/batch_predict/{model}', [body],
+                              content_type, concurrency, args.batch_rows))
+
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'server': target.name,
+        'config': vars(args),
+        'cold_start_seconds': dashboard.warmup_state.get('cold_start_seconds'),
+        'scenarios': {},
+    }
+    try:
+        for name, path, bodies, content_type, concurrency, rows in scenarios:
+            if args.warmup_requests:
+                run_scenario(target, path, bodies, content_type, concurrency, args.duration, args.warmup_requests, rows)
+            report = run_scenario(target, path, bodies, content_type, concurrency, args.duration, args.requests, rows)
+            results['scenarios'][name] = report
+            latency = report['latency_ms']
+            print(f"📊 {name}: {report['throughput_rps']:.1f} req/s, p50 {latency.get('p50', 0):.2f}ms, "
+                  f"p99 {latency.get('p99', 0):.2f}ms, {report['errors']} errors, CPU {report['cpu_percent']:.0f}%")
+    finally:
+        target.close()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Results written to {os.path.abspath(args.output)}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"🔍 Compared with {args.baseline} (tolerance {args.tolerance:.0%}):")
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+# Ordered parallel chunk pipeline for batch scoring
+# The caller's thread reads chunks, a thread pool scores them, and results are
+# yielded back in input order as soon as the head of the queue is done
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def default_workers():
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def ordered_parallel_map(fn, items, workers=None, max_in_flight=None):
+    """Apply fn to every item on a thread pool, yielding results in input order.
+
+    At most max_in_flight items are read ahead of the oldest unfinished result,
+    which bounds memory no matter how large the input is.
+    """
+    workers = workers or default_workers()
+    if workers <= 1:
+        # Serial fallback keeps the single-core path free of pool overhead
+        for item in items:
+            yield fn(item)
+        return
+
+    max_in_flight = max_in_flight or workers * 2
+    pool = ThreadPoolExecutor(workers, thread_name_prefix='chunk-worker')
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(pool.submit(fn, item))
+
+            # Stream finished results from the head without waiting on the rest
+            while pending and pending[0].done():
+                yield pending.popleft().result()
+
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Client went away or a chunk failed: drop work that has not started
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
@@ -5,7 +5,6 @@ import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split, cross_val_score, GridSearchCV
 from sklearn.preprocessing import StandardScaler, RobustScaler, PowerTransformer
-from sklearn.impute import SimpleImputer, KNNImputer
 from sklearn.linear_model import LinearRegression, LogisticRegression, Ridge, Lasso
 from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier, GradientBoostingRegressor, GradientBoostingClassifier
 from sklearn.svm import SVR, SVC
@@ -13,6 +12,20 @@ from sklearn.metrics import mean_squared_error, r2_score, accuracy_score, classi
 from sklearn.feature_selection import SelectKBest, f_regression, f_classif, RFE
 import joblib
 import os
+from tree_engine import compile_tree_ensemble
+from inference_pipeline import FusedPipeline
+from serving_format import export_pipeline
+from feature_store import FeatureStore
+from sampling import ReservoirSampler
+from rba_schema import read_options
+from feature_cache import FeatureCache, code_version, write_json
+from imputation import ColumnImputer
+from grouped_features import GroupedFeatures
+import imputation
+import grouped_features
+import feature_store
+import sampling
+import rba_schema
 import gc
 import psutil
 import warnings
@@ -26,42 +39,44 @@ def get_memory_usage():
     process = psutil.Process(os.getpid())
     return process.memory_info().rss / 1024 / 1024 / 1024
 
-def safe_load_data(file_path, sample_size=None, chunk_size=100000):
-    """Enhanced data loading with better memory management"""
+def default_sample_size():
+    """Sample size for the available memory, rounded down so small fluctuations keep the same size"""
+    available_memory = psutil.virtual_memory().available / 1024 / 1024 / 1024
+    # More aggressive sampling for better performance
+    # The typed schema holds a raw row in ~60 bytes (~750 with inferred dtypes),
+    # so feature engineering and training now dominate the per-row budget
+    sample_size = int(available_memory * 1000000) // 250000 * 250000
+    return max(sample_size, 100000)  # Increased minimum
+
+def safe_load_data(file_path, sample_size=None, chunk_size=100000, seed=42, stratify=None, min_per_stratum=0):
+    """Load a uniform random sample of the CSV in one streaming pass.
+
+    Rows are reservoir-sampled across the whole file instead of taking its head,
+    so the sample covers the full time range. Pass a column (e.g. 'Is Attack IP')
+    as stratify to sample each of its values in proportion, with at least
+    min_per_stratum rows each.
+    """
     print(f"Current memory usage: {get_memory_usage():.2f} GB")
     
-    # Get total rows without loading full dataset
-    total_rows = sum(1 for line in open(file_path)) - 1
-    print(f"Total rows in dataset: {total_rows:,}")
-    
     if sample_size is None:
-        available_memory = psutil.virtual_memory().available / 1024 / 1024 / 1024
-        # More aggressive sampling for better performance
-        sample_size = min(int(available_memory * 400000), total_rows)
-        sample_size = max(sample_size, 100000)  # Increased minimum
+        sample_size = default_sample_size()
     
-    print(f"Using sample size: {sample_size:,} rows")
+    print(f"Using sample size: {sample_size:,} rows (seed {seed})")
     
-    chunks = []
-    rows_loaded = 0
+    sampler = ReservoirSampler(sample_size, seed=seed, stratify=stratify, min_per_stratum=min_per_stratum)
     
-    for chunk in pd.read_csv(file_path, chunksize=chunk_size):
-        if rows_loaded >= sample_size:
-            break
-        
-        remaining = sample_size - rows_loaded
-        if len(chunk) > remaining:
-            chunk = chunk.head(remaining)
-        
-        chunks.append(chunk)
-        rows_loaded += len(chunk)
+    # Declared dtypes and column projection (rba_schema.py) instead of inferred int64/float64/object
+    chunks = pd.read_csv(file_path, chunksize=chunk_size, **read_options())
+    for chunk_number, chunk in enumerate(chunks, start=1):
+        sampler.add(chunk)
         
-        if len(chunks) % 10 == 0:
+        if chunk_number % 10 == 0:
             gc.collect()
-            print(f"Loaded {rows_loaded:,} rows, Memory: {get_memory_usage():.2f} GB")
+            print(f"Scanned {sampler.rows_seen:,} rows, Memory: {get_memory_usage():.2f} GB")
     
-    df = pd.concat(chunks, ignore_index=True)
-    del chunks
+    print(f"Total rows in dataset: {sampler.rows_seen:,}")
+    df = sampler.sample()
+    del sampler
     gc.collect()
     
     print(f"Final dataset shape: {df.shape}")
@@ -93,20 +108,27 @@ def create_advanced_features(df):
         df_features['day_cos'] = np.cos(2 * np.pi * df_features['day_of_week'] / 7)
     
     # 2. Advanced categorical encodings
+    # Grouped features factorize each key once and compute all of its aggregates in one pass
+    rtt = 'Round-Trip Time [ms]'
     categorical_cols = ['Country', 'Region', 'City', 'Browser Name and Version', 'OS Name and Version', 'Device Type']
+    country_rtt_mean = None
     
     for col in categorical_cols:
         if col in df_features.columns:
-            # Frequency encoding
-            freq_encoding = df_features[col].value_counts(normalize=True)
-            df_features[f'{col}_freq'] = df_features[col].map(freq_encoding)
-            df_features[f'{col}_freq'] = df_features[f'{col}_freq'].fillna(0)
+            aggregations = {'size': (None, 'size')}
+            if rtt in df_features.columns:
+                aggregations['rtt_mean'] = (rtt, 'mean')
+            stage = GroupedFeatures(col, aggregations)
+            encoded = stage.fit_transform(df_features)
+            
+            # Frequency encoding (share of the rows where the value is known)
+            df_features[f'{col}_freq'] = (encoded['size'] / max(stage.sizes.sum(), 1)).fillna(0)
             
             # Target encoding (if target available)
-            if 'Round-Trip Time [ms]' in df_features.columns:
-                target_encoding = df_features.groupby(col)['Round-Trip Time [ms]'].mean()
-                df_features[f'{col}_target_enc'] = df_features[col].map(target_encoding)
-                df_features[f'{col}_target_enc'] = df_features[f'{col}_target_enc'].fillna(df_features['Round-Trip Time [ms]'].mean())
+            if rtt in df_features.columns:
+                df_features[f'{col}_target_enc'] = encoded['rtt_mean'].fillna(df_features[rtt].mean())
+                if col == 'Country':
+                    country_rtt_mean = encoded['rtt_mean']
     
     # 3. Advanced RTT features
     if 'Round-Trip Time [ms]' in df_features.columns:
@@ -123,35 +145,38 @@ def create_advanced_features(df):
         df_features['rtt_reciprocal'] = 1 / (1 + df_features['Round-Trip Time [ms]'])
         
         # RTT statistics by groups
-        if 'Country' in df_features.columns:
-            country_rtt_mean = df_features.groupby('Country')['Round-Trip Time [ms]'].transform('mean')
+        if country_rtt_mean is not None:
             df_features['rtt_vs_country_mean'] = df_features['Round-Trip Time [ms]'] - country_rtt_mean
     
     # 4. Advanced user behavior features
     if 'User ID' in df_features.columns:
-        user_stats = df_features.groupby('User ID').agg({
-            'Round-Trip Time [ms]': ['count', 'mean', 'std', 'min', 'max'],
-            'Login Timestamp': 'count'
-        }).fillna(0)
-        
-        user_stats.columns = ['user_login_count', 'user_rtt_mean', 'user_rtt_std', 'user_rtt_min', 'user_rtt_max', 'user_total_logins']
+        user_stats = GroupedFeatures('User ID', {
+            'user_login_count': (rtt, 'count'),
+            'user_rtt_mean': (rtt, 'mean'),
+            'user_rtt_std': (rtt, 'std'),
+            'user_rtt_min': (rtt, 'min'),
+            'user_rtt_max': (rtt, 'max'),
+            'user_total_logins': ('Login Timestamp', 'count'),
+        }).fit_transform(df_features, fill_value=0).fillna(0)
         
         for col in user_stats.columns:
-            df_features[col] = df_features['User ID'].map(user_stats[col])
-            df_features[col] = df_features[col].fillna(0)
+            df_features[col] = user_stats[col]
     
-    # 5. Advanced IP-based features
+    # 5. Advanced IP-based features (the attack count is computed in the same pass)
+    ip_stats = None
     if 'IP Address' in df_features.columns:
-        ip_stats = df_features.groupby('IP Address').agg({
-            'Round-Trip Time [ms]': ['count', 'mean', 'std'],
-            'User ID': 'nunique'
-        }).fillna(0)
-        
-        ip_stats.columns = ['ip_login_count', 'ip_rtt_mean', 'ip_rtt_std', 'ip_unique_users']
+        aggregations = {
+            'ip_login_count': (rtt, 'count'),
+            'ip_rtt_mean': (rtt, 'mean'),
+            'ip_rtt_std': (rtt, 'std'),
+            'ip_unique_users': ('User ID', 'nunique'),
+        }
+        if 'Is Attack IP' in df_features.columns:
+            aggregations['ip_attack_count'] = ('Is Attack IP', 'sum')
+        ip_stats = GroupedFeatures('IP Address', aggregations).fit_transform(df_features, fill_value=0).fillna(0)
         
-        for col in ip_stats.columns:
-            df_features[col] = df_features['IP Address'].map(ip_stats[col])
-            df_features[col] = df_features[col].fillna(0)
+        for col in ['ip_login_count', 'ip_rtt_mean', 'ip_rtt_std', 'ip_unique_users']:
+            df_features[col] = ip_stats[col]
     
     # 6. Interaction features
     if all(col in df_features.columns for col in ['hour', 'day_of_week', 'Country']):
@@ -163,10 +188,8 @@ def create_advanced_features(df):
         df_features['Is Attack IP'] = df_features['Is Attack IP'].astype(int)
         
         # Attack patterns
-        if 'IP Address' in df_features.columns:
-            attack_ip_count = df_features.groupby('IP Address')['Is Attack IP'].sum()
-            df_features['ip_attack_count'] = df_features['IP Address'].map(attack_ip_count)
-            df_features['ip_attack_count'] = df_features['ip_attack_count'].fillna(0)
+        if ip_stats is not None:
+            df_features['ip_attack_count'] = ip_stats['ip_attack_count']
     
     if 'Is Account Takeover' in df_features.columns:
         df_features['Is Account Takeover'] = df_features['Is Account Takeover'].astype(int)
@@ -178,25 +201,14 @@ def create_advanced_features(df):
     numeric_cols = df_features.select_dtypes(include=[np.number]).columns
     df_numeric = df_features[numeric_cols]
     
-    # Advanced imputation
+    # Per-column imputation: known fills, medians, and an indexed KNN only where it helps
     print("Performing advanced imputation...")
-    
-    # Use KNN imputation for better results
-    try:
-        imputer = KNNImputer(n_neighbors=5)
-        df_numeric_imputed = pd.DataFrame(
-            imputer.fit_transform(df_numeric),
-            columns=df_numeric.columns,
-            index=df_numeric.index
-        )
-    except:
-        # Fallback to median imputation
-        imputer = SimpleImputer(strategy='median')
-        df_numeric_imputed = pd.DataFrame(
-            imputer.fit_transform(df_numeric),
-            columns=df_numeric.columns,
-            index=df_numeric.index
-        )
+    imputer = ColumnImputer(n_neighbors=5)
+    df_numeric_imputed = imputer.fit_transform(df_numeric)
+    for entry in imputer.report:
+        print(f"  {entry['column']}: {entry['strategy']} for {entry['missing']:,} rows in {entry['seconds'] * 1000:.1f} ms")
+    if imputer.dropped:
+        print(f"  Dropped empty columns: {imputer.dropped}")
     
     print(f"Created {len(numeric_cols)} advanced features")
     print(f"Handled {df_numeric.isna().sum().sum()} NaN values")
@@ -379,21 +391,53 @@ def train_enhanced_classification_model(X, y, target_name):
     
     return best_model, scaler, best_score, selected_features, selector
 
+def atomic_dump(obj, path):
+    """Dump uncompressed to a temp file and rename it into place"""
+    # A running server may have the old file memory-mapped; renaming keeps its
+    # pages valid instead of rewriting them underneath it
+    tmp_path = f'{path}.tmp'
+    joblib.dump(obj, tmp_path, compress=0)
+    os.replace(tmp_path, path)
+
 def save_model_with_metadata(model, scaler, selector, selected_features, model_name, performance_score):
     """Save model with comprehensive metadata"""
     os.makedirs('models', exist_ok=True)
-    
-    # Save model components
-    joblib.dump(model, f'models/{model_name}_model.pkl')
-    joblib.dump(scaler, f'models/{model_name}_scaler.pkl')
-    joblib.dump(selector, f'models/{model_name}_selector.pkl')
-    joblib.dump(selected_features, f'models/{model_name}_features.pkl')
+    # Recorded in the manifest and the serving export, which is only served while the two match
+    version = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    
+    # Save model components uncompressed so the server can memory-map their arrays
+    atomic_dump(model, f'models/{model_name}_model.pkl')
+    atomic_dump(scaler, f'models/{model_name}_scaler.pkl')
+    atomic_dump(selector, f'models/{model_name}_selector.pkl')
+    atomic_dump(selected_features, f'models/{model_name}_features.pkl')
+    
+    # Export tree ensembles to the flat NumPy engine used for serving
+    engine = compile_tree_ensemble(model)
+    engine_path = f'models/{model_name}_engine.pkl'
+    if engine is not None:
+        atomic_dump(engine, engine_path)
+    elif os.path.exists(engine_path):
+        # Drop a stale engine from a previous tree model with the same name
+        os.remove(engine_path)
+    
+    # Fused scaler + model object the server loads instead of the separate parts
+    pipeline = FusedPipeline(selected_features, scaler, engine if engine is not None else model)
+    atomic_dump(pipeline, f'models/{model_name}_pipeline.pkl')
+    
+    # NumPy-only copy of the pipeline that the server loads without joblib or sklearn
+    serving_path = f'models/{model_name}_serving.bin'
+    serving_export = export_pipeline(pipeline, serving_path, version)
+    if not serving_export and os.path.exists(serving_path):
+        os.remove(serving_path)
     
     # Save metadata
     metadata = {
         'model_name': model_name,
         'model_type': type(model).__name__,
         'scaler_type': type(scaler).__name__,
+        'flat_engine': engine is not None,
+        'pipeline_kind': pipeline.kind,
+        'serving_export': serving_export,
         'performance_score': performance_score,
         'n_features': len(selected_features),
         'selected_features': selected_features,
@@ -403,22 +447,75 @@ def save_model_with_metadata(model, scaler, selector, selected_features, model_n
     
     joblib.dump(metadata, f'models/{model_name}_metadata.pkl')
     
+    # Written last and atomically: the server reloads only once this changes,
+    # so it never picks up a bundle whose parts are still being written
+    write_json(f'models/{model_name}_version.json', {
+        'version': version,
+        'created_at': metadata['created_at'],
+    })
+    
     print(f"✅ {model_name} model saved with metadata!")
 
 print("🚀 === Enhanced Model Training for Mac ===")
 print("Advanced techniques for maximum performance!")
 
-# Step 1: Load data
-print("\n1. Loading dataset...")
-df = safe_load_data('login/rba-dataset.csv')
+DATA_PATH = 'login/rba-dataset.csv'
+
+# Engineered features are cached here between runs (set to an empty string to disable)
+FEATURE_CACHE_DIR = os.environ.get('FEATURE_CACHE_DIR', 'feature_cache')
 
-# Step 2: Create advanced features
-print("\n2. Creating advanced features...")
-df_features = create_advanced_features(df)
+# Rows to sample: a fixed count, so the feature cache key is the same on every run,
+# or 'auto' to size it from the memory available now (which changes the key between runs)
+SAMPLE_SIZE = os.environ.get('SAMPLE_SIZE', '1000000')
+if SAMPLE_SIZE == 'auto':
+    sample_size = default_sample_size()
+else:
+    sample_size = int(SAMPLE_SIZE)
+    if sample_size > default_sample_size():
+        print(f"⚠️ SAMPLE_SIZE={sample_size:,} is more than the {default_sample_size():,} rows suggested for the available memory")
 
-# Memory cleanup
-del df
-gc.collect()
+# Everything that decides which rows are sampled; part of the cache key
+sample_spec = {'sample_size': sample_size, 'seed': 42, 'stratify': None, 'min_per_stratum': 0}
+os.makedirs('models', exist_ok=True)
+
+feature_cache = None
+cache_key = None
+if FEATURE_CACHE_DIR:
+    try:
+        import pyarrow  # noqa: F401
+        feature_cache = FeatureCache(FEATURE_CACHE_DIR)
+        cache_key = feature_cache.key(DATA_PATH, sample_spec, code_version(
+            safe_load_data, create_advanced_features, sampling, rba_schema, imputation, grouped_features,
+            feature_store))
+    except ImportError:
+        print("⚠️ pyarrow is not installed, feature caching is disabled")
+
+df_features = feature_cache.load(cache_key) if feature_cache is not None else None
+if df_features is not None:
+    print(f"\n⚡ Loaded {df_features.shape[0]:,} x {df_features.shape[1]} engineered features from cache {cache_key}")
+    if not feature_cache.restore(cache_key, 'feature_store.pkl', 'models/feature_store.pkl'):
+        print("⚠️ Cached entry has no feature store snapshot, keeping models/feature_store.pkl as is")
+else:
+    # Step 1: Load data
+    print("\n1. Loading dataset...")
+    df = safe_load_data(DATA_PATH, **sample_spec)
+    
+    # Seed the serving feature store with the same per-user and per-IP history
+    print("\n💾 Exporting online feature store...")
+    FeatureStore.from_frame(df).save('models/feature_store.pkl')
+    
+    # Step 2: Create advanced features
+    print("\n2. Creating advanced features...")
+    df_features = create_advanced_features(df)
+    
+    # Memory cleanup
+    del df
+    gc.collect()
+    
+    if feature_cache is not None:
+        feature_cache.save(cache_key, df_features, meta={'data_path': DATA_PATH, 'sample_spec': sample_spec},
+                           files={'feature_store.pkl': 'models/feature_store.pkl'})
+        print(f"💾 Cached engineered features as {cache_key}")
 
 # Step 3: Train enhanced models
 print("\n3. Training enhanced models...")
@@ -0,0 +1,131 @@
+# Content-addressed cache of the engineered feature matrix
+# The features of a training run depend only on the input file's bytes, the
+# sample spec and the feature-engineering code, so those are hashed into a key
+# and the matrix is stored under it as an uncompressed Feather (Arrow IPC)
+# file. Reloading memory-maps that file, so a run that only changes model
+# settings skips loading and feature engineering.
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+
+FEATURES_FILE = 'features.feather'
+META_FILE = 'meta.json'
+DIGESTS_FILE = 'digests.json'
+
+
+def hash_file(path, block_size=8 * 1024 * 1024):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                return digest.hexdigest()
+            digest.update(block)
+
+
+def code_version(*objects):
+    """Hash of the source of the functions / modules that produce the features"""
+    digest = hashlib.blake2b(digest_size=16)
+    for obj in objects:
+        digest.update(inspect.getsource(obj).encode())
+    return digest.hexdigest()
+
+
+def write_json(path, data):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+class FeatureCache:
+    """Engineered feature matrices keyed by (input file hash, sample spec, code version)"""
+
+    def __init__(self, cache_dir, max_entries=5):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def file_digest(self, path):
+        """Content hash of a data file, remembered by size and mtime so an unchanged file is read only once"""
+        stat = os.stat(path)
+        digests_path = os.path.join(self.cache_dir, DIGESTS_FILE)
+        try:
+            with open(digests_path) as f:
+                digests = json.load(f)
+        except (OSError, ValueError):
+            digests = {}
+        known = digests.get(os.path.abspath(path))
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['digest']
+
+        digest = hash_file(path)
+        digests[os.path.abspath(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        write_json(digests_path, digests)
+        return digest
+
+    def key(self, data_path, spec, version):
+        parts = {'data': self.file_digest(data_path), 'spec': spec, 'code': version}
+        return hashlib.blake2b(json.dumps(parts, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+
+    def load(self, key):
+        """The cached feature DataFrame, memory-mapped, or None on a miss"""
+        path = os.path.join(self._entry(key), FEATURES_FILE)
+        if not os.path.exists(path):
+            return None
+        import pyarrow as pa
+
+        # The table's buffers keep the mapping alive; split blocks let NaN-free numeric columns stay zero-copy
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        os.utime(self._entry(key))
+        return table.to_pandas(split_blocks=True)
+
+    def restore(self, key, name, destination):
+        """Copy a file saved alongside an entry back into place, returns False if it is missing"""
+        source = os.path.join(self._entry(key), name)
+        if not os.path.exists(source):
+            return False
+        shutil.copyfile(source, destination)
+        return True
+
+    def save(self, key, frame, meta=None, files=None):
+        """Store a feature DataFrame (and copies of files) under key, then drop the oldest entries"""
+        import pyarrow as pa
+        import pyarrow.feather as feather
+
+        entry = self._entry(key)
+        tmp_entry = f'{entry}.tmp'
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        os.makedirs(tmp_entry)
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        # Uncompressed, so the file can be memory-mapped as is
+        feather.write_feather(table, os.path.join(tmp_entry, FEATURES_FILE), compression='uncompressed')
+        for name, source in (files or {}).items():
+            shutil.copyfile(source, os.path.join(tmp_entry, name))
+        write_json(os.path.join(tmp_entry, META_FILE), {
+            'key': key,
+            'rows': len(frame),
+            'columns': list(frame.columns),
+            'created_at': time.time(),
+            **(meta or {}),
+        })
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp_entry, entry)
+        self.prune()
+
+    def prune(self):
+        """Keep only the max_entries most recently used entries"""
+        entries = [
+            os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+            if os.path.isdir(os.path.join(self.cache_dir, name)) and not name.endswith('.tmp')
+        ]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for entry in entries[self.max_entries:]:
+            shutil.rmtree(entry, ignore_errors=True)
@@ -0,0 +1,529 @@
+# Online feature store for per-user and per-IP aggregates
+# Serves the user_* / ip_* features that training computes with groupbys over
+# the whole dataset. Running statistics are kept for every User ID and IP
+# Address (Welford mean/variance, min/max, a distinct-user sketch), so lookups
+# and updates are O(1) per request. Scoring only reads the store: a login is
+# added to the history when it is recorded, once, and recorded logins go
+# through an append-only journal that every worker process replays, which
+# also makes them survive a restart. Once the journal grows past a size limit
+# it is folded into the snapshot, which is swapped in atomically, and
+# truncated; the other workers notice the new snapshot and reload it.
+
+import hashlib
+import json
+import math
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process journal lock, so the journal is never compacted
+    fcntl = None
+
+USER_FEATURES = ('user_login_count', 'user_rtt_mean', 'user_rtt_std', 'user_rtt_min', 'user_rtt_max', 'user_total_logins')
+IP_FEATURES = ('ip_login_count', 'ip_rtt_mean', 'ip_rtt_std', 'ip_unique_users', 'ip_attack_count')
+STORE_FEATURES = frozenset(USER_FEATURES + IP_FEATURES)
+
+# Request fields a recorded login keeps
+LOGIN_FIELDS = ('User ID', 'IP Address', 'Round-Trip Time [ms]', 'Is Attack IP')
+
+# Distinct users per IP are counted exactly up to this many, then with a HyperLogLog
+EXACT_DISTINCT_LIMIT = 64
+HLL_PRECISION = 10
+HLL_REGISTERS = 1 << HLL_PRECISION
+HLL_ALPHA = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+
+
+def hash64(value):
+    """Stable 64-bit hash, the same in every process (unlike hash())"""
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+
+
+class DistinctCounter:
+    """Exact set of hashes for small cardinalities, a HyperLogLog sketch beyond that"""
+
+    __slots__ = ('_exact', '_registers', '_inverse_sum', '_zeros')
+
+    def __init__(self):
+        self._exact = set()
+        self._registers = None
+
+    def copy(self):
+        other = DistinctCounter.__new__(DistinctCounter)
+        other.__setstate__(self.__getstate__())
+        other._exact = set(self._exact) if self._exact is not None else None
+        other._registers = bytearray(self._registers) if self._registers is not None else None
+        return other
+
+    def add(self, hashed):
+        if self._registers is None:
+            self._exact.add(hashed)
+            if len(self._exact) > EXACT_DISTINCT_LIMIT:
+                self._to_sketch()
+            return
+        self._add_to_sketch(hashed)
+
+    def _to_sketch(self):
+        self._registers = bytearray(HLL_REGISTERS)
+        # Running sum of 2^-register and count of empty registers keep count() O(1)
+        self._inverse_sum = float(HLL_REGISTERS)
+        self._zeros = HLL_REGISTERS
+        for hashed in self._exact:
+            self._add_to_sketch(hashed)
+        self._exact = None
+
+    def _add_to_sketch(self, hashed):
+        index = hashed >> (64 - HLL_PRECISION)
+        rest = hashed & ((1 << (64 - HLL_PRECISION)) - 1)
+        rank = 64 - HLL_PRECISION - rest.bit_length() + 1
+        old = self._registers[index]
+        if rank > old:
+            self._registers[index] = rank
+            self._inverse_sum += 2.0 ** -rank - 2.0 ** -old
+            if old == 0:
+                self._zeros -= 1
+
+    def count(self):
+        if self._registers is None:
+            return len(self._exact)
+        estimate = HLL_ALPHA * HLL_REGISTERS * HLL_REGISTERS / self._inverse_sum
+        if estimate <= 2.5 * HLL_REGISTERS and self._zeros:
+            # Linear counting is more accurate while many registers are empty
+            estimate = HLL_REGISTERS * math.log(HLL_REGISTERS / self._zeros)
+        return round(estimate)
+
+    def __getstate__(self):
+        return (self._exact, self._registers,
+                getattr(self, '_inverse_sum', None), getattr(self, '_zeros', None))
+
+    def __setstate__(self, state):
+        self._exact, self._registers, self._inverse_sum, self._zeros = state
+
+
+class KeyStats:
+    """Running aggregates for one User ID or IP Address"""
+
+    __slots__ = ('logins', 'count', 'mean', 'm2', 'min', 'max', 'attacks', 'users')
+
+    def __init__(self, track_users=False):
+        self.logins = 0
+        # RTT statistics skip logins without an RTT, like pandas does with NaN
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.attacks = 0
+        self.users = DistinctCounter() if track_users else None
+
+    def copy(self):
+        other = KeyStats.__new__(KeyStats)
+        other.__setstate__(self.__getstate__())
+        if self.users is not None:
+            other.users = self.users.copy()
+        return other
+
+    def add_login(self, rtt, attack, user_hash):
+        self.logins += 1
+        if rtt is not None:
+            self.add_rtt(rtt)
+        if attack:
+            self.attacks += attack
+        if self.users is not None and user_hash is not None:
+            self.users.add(user_hash)
+
+    def add_rtt(self, rtt):
+        self.count += 1
+        delta = rtt - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (rtt - self.mean)
+        self.min = min(self.min, rtt)
+        self.max = max(self.max, rtt)
+
+    def std(self):
+        # Sample standard deviation (ddof=1); training fills the undefined case with 0
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+def number(value):
+    """Float value of a request field, or None if it is missing or not a finite number"""
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def snapshot_id(path):
+    """Identity of the snapshot file on disk (replacing it changes the inode), or None if missing"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def read_snapshot(path):
+    """(max_keys, users, ips) pickled by FeatureStore.save"""
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def login_fields(record):
+    """The part of a request record that a recorded login keeps"""
+    return {name: record.get(name) for name in LOGIN_FIELDS if record.get(name) is not None}
+
+
+def parse_login(record):
+    """(user, ip, rtt, attack, user hash) of a record, keys as strings"""
+    user = record.get('User ID')
+    ip = record.get('IP Address')
+    return (
+        str(user) if user is not None else None,
+        str(ip) if ip is not None else None,
+        number(record.get('Round-Trip Time [ms]')),
+        number(record.get('Is Attack IP')),
+        hash64(user) if user is not None else None,
+    )
+
+
+class LoginJournal:
+    """Append-only JSON-lines file of recorded logins, shared by every worker process on the host"""
+
+    def __init__(self, path):
+        self.path = path
+        self._offset = 0
+        self._partial = b''
+
+    @contextmanager
+    def lock(self, exclusive=False, blocking=True):
+        """flock on the journal: appends and reads share it, compaction holds it exclusively.
+
+        Yields the open file descriptor, or None when blocking is False and the
+        lock is taken.
+        """
+        fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(fd, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                                | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    yield None
+                    return
+            yield fd
+        finally:
+            os.close(fd)
+
+    def append(self, records):
+        """Append records, returns the journal size in bytes afterwards"""
+        data = ''.join(json.dumps(record, default=str) + '\n' for record in records).encode()
+        # O_APPEND: concurrent writers never overwrite each other's lines
+        with self.lock() as fd:
+            os.write(fd, data)
+            return os.fstat(fd).st_size
+
+    def truncate(self, fd):
+        """Empty the journal once its records are in the snapshot; fd must hold the exclusive lock"""
+        os.ftruncate(fd, 0)
+        self.reset()
+
+    def reset(self):
+        """Read the journal from the start again"""
+        self._offset, self._partial = 0, b''
+
+    def read_new(self):
+        """Records appended since the last call, by this or any other process"""
+        try:
+            size = os.stat(self.path).st_size
+        except FileNotFoundError:
+            return []
+        if size < self._offset:
+            # Truncated or replaced: what was already applied stays, new lines are read from the start
+            print(f"⚠️ Login journal {self.path} shrank, reading it from the start")
+            self.reset()
+        if size == self._offset:
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+        self._offset += len(data)
+        # A line still being written is kept until its newline arrives
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()
+        return [json.loads(line) for line in lines if line]
+
+
+class FeatureStore:
+    """Per-user and per-IP aggregates, bounded with LRU eviction"""
+
+    def __init__(self, max_keys=1000000, journal=None, path=None):
+        self.max_keys = max_keys
+        # Recorded logins are shared and persisted through this journal (in-process only when None)
+        self.journal = journal
+        # Snapshot the journal is compacted into, and reloaded from when another process compacts it
+        self.path = path
+        # Seconds fill() may serve without looking for newly recorded logins
+        self.sync_interval = 0.0
+        # Journal size in bytes that triggers a compaction (0 never compacts)
+        self.compact_bytes = 0
+        self._users = OrderedDict()
+        self._ips = OrderedDict()
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._snapshot = snapshot_id(path) if path is not None else None
+        self._synced_at = 0.0
+        self._compacting = False
+
+    def __len__(self):
+        return len(self._users) + len(self._ips)
+
+    @property
+    def enabled(self):
+        return self.max_keys > 0
+
+    @staticmethod
+    def columns(features):
+        """(name, column) pairs of a model's features that this store can supply"""
+        return tuple((name, i) for i, name in enumerate(features) if name in STORE_FEATURES)
+
+    def _stats(self, table, key, track_users):
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = KeyStats(track_users)
+            if len(table) > self.max_keys:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return stats
+
+    def observe(self, record):
+        """Add one login (a raw request record) to its user's and IP's aggregates"""
+        user, ip, rtt, attack, user_hash = parse_login(record)
+        with self._lock:
+            if user is not None:
+                self._stats(self._users, user, False).add_login(rtt, None, None)
+            if ip is not None:
+                self._stats(self._ips, ip, True).add_login(rtt, attack, user_hash)
+
+    def record(self, records):
+        """Add real logins to the history, once each: through the journal when there is one"""
+        if not self.enabled:
+            return
+        if self.journal is None:
+            for record in records:
+                self.observe(record)
+            return
+        size = self.journal.append([login_fields(record) for record in records])
+        self.sync()
+        if self.compact_bytes and size >= self.compact_bytes:
+            self._compact_in_background()
+
+    def sync(self, max_age=0.0):
+        """Apply logins other workers (or this one) have recorded since the last sync.
+
+        With max_age, skips syncing if the last sync is more recent than that, or
+        if another thread or process holds the journal (e.g. while compacting).
+        """
+        if self.journal is None:
+            return
+        blocking = not max_age
+        if not blocking and time.monotonic() - self._synced_at < max_age:
+            return
+        if not self._sync_lock.acquire(blocking):
+            return
+        try:
+            with self.journal.lock(blocking=blocking) as fd:
+                if fd is None:
+                    return
+                self._apply_journal()
+        finally:
+            self._sync_lock.release()
+
+    def _apply_journal(self):
+        """Reload a snapshot replaced by another process, then apply new journal lines (journal locked)"""
+        if self.path is not None:
+            snapshot = snapshot_id(self.path)
+            if snapshot != self._snapshot:
+                # Compacted elsewhere (or retrained): the snapshot holds what the journal held before
+                if snapshot is not None:
+                    users, ips = read_snapshot(self.path)[1:]
+                    with self._lock:
+                        self._users, self._ips = users, ips
+                    print(f"🔄 Feature store reloaded from {self.path}")
+                self._snapshot = snapshot
+                self.journal.reset()
+        for record in self.journal.read_new():
+            self.observe(record)
+        self._synced_at = time.monotonic()
+
+    def compact(self):
+        """Fold the journal into the snapshot and truncate it.
+
+        Returns False if there is nothing to compact into, or another process
+        already holds the journal.
+        """
+        if self.journal is None or self.path is None or fcntl is None:
+            return False
+        with self._sync_lock, self.journal.lock(exclusive=True, blocking=False) as fd:
+            if fd is None:
+                return False
+            self._apply_journal()
+            # Written to a temp file and renamed: readers see the old or the new snapshot
+            self.save(self.path)
+            self._snapshot = snapshot_id(self.path)
+            self.journal.truncate(fd)
+        print(f"🗜️ Login journal compacted into {self.path} ({len(self)} users and IPs)")
+        return True
+
+    def _compact_in_background(self):
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"❌ Error compacting the login journal: {e}")
+            finally:
+                self._compacting = False
+
+        threading.Thread(target=run, name='feature-store-compact', daemon=True).start()
+
+    def lookup(self, record, include=False):
+        """Current user_* and ip_* feature values for a record's User ID and IP Address.
+
+        With include, the values are computed as if the record's login were in the
+        history too, without adding it.
+        """
+        values = dict.fromkeys(STORE_FEATURES, 0.0)
+        user_key, ip_key, rtt, attack, user_hash = parse_login(record)
+        with self._lock:
+            user = self._users.get(user_key)
+            ip = self._ips.get(ip_key)
+            if include:
+                if user_key is not None:
+                    user = user.copy() if user is not None else KeyStats(False)
+                    user.add_login(rtt, None, None)
+                if ip_key is not None:
+                    ip = ip.copy() if ip is not None else KeyStats(True)
+                    ip.add_login(rtt, attack, user_hash)
+            if user is not None:
+                has_rtt = user.count > 0
+                values.update({
+                    'user_login_count': user.count,
+                    'user_rtt_mean': user.mean,
+                    'user_rtt_std': user.std(),
+                    'user_rtt_min': user.min if has_rtt else 0.0,
+                    'user_rtt_max': user.max if has_rtt else 0.0,
+                    'user_total_logins': user.logins,
+                })
+            if ip is not None:
+                values.update({
+                    'ip_login_count': ip.count,
+                    'ip_rtt_mean': ip.mean,
+                    'ip_rtt_std': ip.std(),
+                    'ip_unique_users': ip.users.count(),
+                    'ip_attack_count': ip.attacks,
+                })
+        return values
+
+    def fill(self, row, record, columns):
+        """Write a login's aggregate features into row without changing the store.
+
+        Training aggregates include the row itself, so the login is counted in as
+        if it were recorded. Values the caller sent explicitly are kept.
+        """
+        if not self.enabled or not columns:
+            return row
+        self.sync(self.sync_interval)
+        values = self.lookup(record, include=True)
+        for name, i in columns:
+            if record.get(name) is None:
+                row[i] = values[name]
+        return row
+
+    @classmethod
+    def from_frame(cls, df, max_keys=1000000):
+        """Store seeded from a raw training frame with the same groupbys training uses"""
+        store = cls(max_keys)
+        for key_column, table, is_ip in (('User ID', store._users, False), ('IP Address', store._ips, True)):
+            if key_column not in df.columns:
+                continue
+            groups = df.groupby(key_column, sort=False)
+            logins = groups.size()
+            n_keys = len(logins)
+            # Each aggregate is pulled out once as a column, then zipped per key
+            if 'Round-Trip Time [ms]' in df.columns:
+                rtt = groups['Round-Trip Time [ms]'].agg(['count', 'mean', 'var', 'min', 'max']).fillna(0)
+                rtt = zip(*(rtt[name].tolist() for name in rtt.columns))
+            else:
+                rtt = [None] * n_keys
+            if is_ip and 'Is Attack IP' in df.columns:
+                attacks = groups['Is Attack IP'].sum().astype(float).tolist()
+            else:
+                attacks = [None] * n_keys
+            if is_ip and 'User ID' in df.columns:
+                users = groups['User ID'].unique().tolist()
+            else:
+                users = [None] * n_keys
+
+            for key, login_count, rtt_stats, attack_count, key_users in zip(
+                    logins.index.tolist(), logins.tolist(), rtt, attacks, users):
+                stats = KeyStats(is_ip)
+                stats.logins = int(login_count)
+                if rtt_stats is not None:
+                    count, mean, var, low, high = rtt_stats
+                    if count:
+                        stats.count = int(count)
+                        stats.mean = mean
+                        stats.m2 = var * (count - 1)
+                        stats.min, stats.max = low, high
+                if attack_count is not None:
+                    stats.attacks = attack_count
+                if key_users is not None:
+                    for user in key_users:
+                        stats.users.add(hash64(user))
+                table[str(key)] = stats
+
+            while len(table) > max_keys:
+                table.popitem(last=False)
+        return store
+
+    def save(self, path):
+        tmp_path = f'{path}.tmp'
+        # Shallow copies under the lock, so lookups are not held up while pickling.
+        # The stats themselves only change in observe(), which compact() keeps out
+        # by holding the sync lock
+        with self._lock:
+            users, ips = self._users.copy(), self._ips.copy()
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((self.max_keys, users, ips), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, journal=None):
+        """Snapshot written by training, with the journal's recorded logins replayed on top"""
+        snapshot = snapshot_id(path)
+        max_keys, users, ips = read_snapshot(path)
+        store = cls(max_keys, journal, path)
+        store._users, store._ips = users, ips
+        # Identity read before the load: if the file was replaced meanwhile, the next sync reloads it
+        store._snapshot = snapshot
+        store.sync()
+        return store
@@ -0,0 +1,200 @@
+# Grouped aggregate features computed from integer key codes
+# Each key column is factorized once (categoricals reuse their codes, so only
+# the categories are hashed); every aggregation for that key is then a
+# bincount or a sorted reduceat over the codes, and results are broadcast
+# back to rows by indexing with the same codes. Partial aggregates merge
+# exactly across chunks, so the same stage also runs over out-of-core data:
+# update() every chunk, then transform() every chunk.
+
+import numpy as np
+import pandas as pd
+
+AGGREGATIONS = ('size', 'count', 'sum', 'mean', 'std', 'min', 'max', 'nunique')
+
+
+class KeyIndex:
+    """Stable integer codes for the values of one column, growing as new values are seen"""
+
+    def __init__(self):
+        self.values = None
+
+    def __len__(self):
+        return 0 if self.values is None else len(self.values)
+
+    def codes(self, column, grow=True):
+        """Code per row; -1 for missing keys (and for unseen keys when grow is False)"""
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            local_codes = column.cat.codes.to_numpy()
+            uniques = column.cat.categories
+        else:
+            local_codes, uniques = pd.factorize(column)
+        uniques = pd.Index(uniques)
+        # Only the distinct values are hashed against the running index
+        mapping = self.values.get_indexer(uniques) if len(self) else np.full(len(uniques), -1, dtype=np.intp)
+        new = mapping < 0
+        if grow and new.any():
+            mapping[new] = np.arange(len(self), len(self) + new.sum())
+            self.values = uniques[new] if self.values is None else self.values.append(uniques[new])
+        # A local code of -1 (missing) picks the trailing -1
+        return np.append(mapping, -1)[local_codes]
+
+
+def broadcast(values, codes, fill_value=np.nan):
+    """values[codes] per row, fill_value where the code is -1"""
+    return np.append(values.astype(float), fill_value)[codes]
+
+
+class GroupedFeatures:
+    """All aggregates over one key, computed in a single vectorized pass per chunk.
+
+    aggregations maps an output name to (column, function); column is ignored
+    for 'size' and function is one of AGGREGATIONS.
+    """
+
+    def __init__(self, key, aggregations):
+        for name, (_, function) in aggregations.items():
+            if function not in AGGREGATIONS:
+                raise ValueError(f'Unknown aggregation {function!r} for {name}')
+        self.key = key
+        self.aggregations = aggregations
+        self.index = KeyIndex()
+        self.sizes = np.zeros(0)
+        # column -> running count / sum / m2 / min / max per key code
+        self.stats = {}
+        # column -> (value codes, distinct (key, value) code pairs) for nunique
+        self.pairs = {}
+        self.functions = {}
+        for column, function in aggregations.values():
+            if function == 'nunique':
+                self.pairs[column] = (KeyIndex(), np.zeros(0, dtype=np.int64))
+            elif function != 'size':
+                self.functions.setdefault(column, set()).add(function)
+
+    def _grow(self, n_keys):
+        extra = n_keys - len(self.sizes)
+        if extra <= 0:
+            return
+        self.sizes = np.concatenate([self.sizes, np.zeros(extra)])
+        for stats in self.stats.values():
+            for name, start in (('count', 0.0), ('sum', 0.0), ('m2', 0.0), ('min', np.inf), ('max', -np.inf)):
+                if name in stats:
+                    stats[name] = np.concatenate([stats[name], np.full(extra, start)])
+
+    def update(self, frame, codes=None):
+        """Add a chunk to the running aggregates, returns its key codes"""
+        if codes is None:
+            codes = self.index.codes(frame[self.key])
+        n_keys = len(self.index)
+        self._grow(n_keys)
+        has_key = codes >= 0
+        self.sizes += np.bincount(codes[has_key], minlength=n_keys)
+
+        order = None
+        for column, functions in self.functions.items():
+            series = frame[column]
+            if functions == {'count'}:
+                # Counting needs no numeric values (e.g. timestamps)
+                valid = has_key & series.notna().to_numpy()
+                values = None
+            else:
+                values = series.to_numpy(dtype=float, na_value=np.nan)
+                valid = has_key & ~np.isnan(values)
+            stats = self.stats.setdefault(column, self._empty_stats(functions, n_keys))
+            chunk_count = np.bincount(codes[valid], minlength=n_keys).astype(float)
+            if values is None:
+                stats['count'] += chunk_count
+                continue
+
+            chunk_sum = np.bincount(codes[valid], weights=values[valid], minlength=n_keys)
+            if 'm2' in stats:
+                # Chan et al.'s merge of (count, mean, M2) from the previous chunks and this one
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    chunk_mean = np.where(chunk_count > 0, chunk_sum / chunk_count, 0.0)
+                    deviation = values[valid] - chunk_mean[codes[valid]]
+                    chunk_m2 = np.bincount(codes[valid], weights=deviation * deviation, minlength=n_keys)
+                    count = stats['count'] + chunk_count
+                    delta = chunk_mean - np.where(stats['count'] > 0, stats['sum'] / stats['count'], 0.0)
+                    stats['m2'] += chunk_m2 + np.where(count > 0, delta * delta * stats['count'] * chunk_count / count, 0.0)
+            stats['count'] += chunk_count
+            stats['sum'] += chunk_sum
+
+            if 'min' in stats or 'max' in stats:
+                if order is None:
+                    # One sort of the codes serves min and max of every column
+                    order = np.argsort(np.where(has_key, codes, n_keys))[:has_key.sum()]
+                    sorted_codes = codes[order]
+                    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if len(order) else order
+                    groups = sorted_codes[starts]
+                if len(order):
+                    sorted_values = values[order]
+                    if 'min' in stats:
+                        stats['min'][groups] = np.fmin(stats['min'][groups], np.fmin.reduceat(sorted_values, starts))
+                    if 'max' in stats:
+                        stats['max'][groups] = np.fmax(stats['max'][groups], np.fmax.reduceat(sorted_values, starts))
+
+        for column, (value_index, pairs) in self.pairs.items():
+            value_codes = value_index.codes(frame[column])
+            both = has_key & (value_codes >= 0)
+            # Distinct (key, value) pairs packed into one int64; hashing beats sorting here
+            chunk_pairs = (codes[both].astype(np.int64) << 32) | value_codes[both]
+            self.pairs[column] = (value_index, pd.unique(np.concatenate([pairs, chunk_pairs])))
+        return codes
+
+    @staticmethod
+    def _empty_stats(functions, n_keys):
+        stats = {'count': np.zeros(n_keys)}
+        if functions - {'count'}:
+            stats['sum'] = np.zeros(n_keys)
+        if 'std' in functions:
+            stats['m2'] = np.zeros(n_keys)
+        if 'min' in functions:
+            stats['min'] = np.full(n_keys, np.inf)
+        if 'max' in functions:
+            stats['max'] = np.full(n_keys, -np.inf)
+        return stats
+
+    def results(self):
+        """Output name -> array of the aggregate per key code (NaN where pandas would give NaN)"""
+        n_keys = len(self.index)
+        results = {}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for name, (column, function) in self.aggregations.items():
+                if function == 'size':
+                    results[name] = self.sizes.copy()
+                    continue
+                if function == 'nunique':
+                    pairs = self.pairs[column][1]
+                    results[name] = np.bincount(pairs >> 32, minlength=n_keys).astype(float)
+                    continue
+                stats = self.stats[column]
+                count = stats['count']
+                if function == 'count':
+                    results[name] = count.copy()
+                elif function == 'sum':
+                    results[name] = stats['sum'].copy()
+                elif function == 'mean':
+                    results[name] = np.where(count > 0, stats['sum'] / count, np.nan)
+                elif function == 'std':
+                    # Sample standard deviation (ddof=1), like pandas
+                    results[name] = np.where(count > 1, np.sqrt(np.maximum(stats['m2'], 0) / (count - 1)), np.nan)
+                else:
+                    results[name] = np.where(count > 0, stats[function], np.nan)
+        return results
+
+    def table(self):
+        """Aggregates as a DataFrame indexed by key value"""
+        return pd.DataFrame(self.results(), index=self.index.values)
+
+    def transform(self, frame, codes=None, fill_value=np.nan):
+        """Aggregates broadcast to the rows of frame (keys not seen by update get fill_value)"""
+        if codes is None:
+            codes = self.index.codes(frame[self.key], grow=False)
+        return pd.DataFrame(
+            {name: broadcast(values, codes, fill_value) for name, values in self.results().items()},
+            index=frame.index,
+        )
+
+    def fit_transform(self, frame, fill_value=np.nan):
+        """update() and transform() over one in-memory frame, factorizing its keys once"""
+        codes = self.update(frame)
+        return self.transform(frame, codes, fill_value)
@@ -0,0 +1,140 @@
+# Scalable missing-value imputation for the engineered feature matrix
+# Replaces a KNNImputer over every column (O(n²) in rows) with a strategy per
+# column: a fixed fill where the meaning of a NaN is known, the median where
+# neighbours would not help, and a k-nearest-neighbour mean only for columns
+# that correlate with complete ones. Columns missing on the same rows share one
+# search, done in a KD-tree over a few standardized predictors and a capped
+# donor sample, in chunks, so the cost grows about linearly with the rows.
+
+import time
+
+import numpy as np
+from sklearn.neighbors import KDTree
+
+# NaNs with a known meaning, from how create_advanced_features builds the column
+KNOWN_FILLS = {
+    # Sample std of a single login is undefined: no spread
+    'user_rtt_std': 0.0,
+    'ip_rtt_std': 0.0,
+    # Users / IPs without any RTT, as the feature store reports them
+    'user_rtt_mean': 0.0,
+    'user_rtt_min': 0.0,
+    'user_rtt_max': 0.0,
+    'ip_rtt_mean': 0.0,
+}
+# Frequency of a value that was never seen
+KNOWN_SUFFIX_FILLS = {'_freq': 0.0}
+
+
+def known_fill(column, fills=KNOWN_FILLS, suffix_fills=KNOWN_SUFFIX_FILLS):
+    if column in fills:
+        return fills[column]
+    for suffix, value in suffix_fills.items():
+        if column.endswith(suffix):
+            return value
+    return None
+
+
+class ColumnImputer:
+    """Fills every NaN in a numeric DataFrame, choosing a strategy per column"""
+
+    def __init__(self, n_neighbors=5, max_donors=100000, max_predictors=6, min_correlation=0.1,
+                 chunk_size=50000, seed=42):
+        self.n_neighbors = n_neighbors
+        self.max_donors = max_donors
+        self.max_predictors = max_predictors
+        self.min_correlation = min_correlation
+        self.chunk_size = chunk_size
+        self.seed = seed
+        # One entry per column: strategy, rows filled, seconds spent
+        self.report = []
+
+    def _record(self, column, strategy, missing, start, **details):
+        self.report.append({'column': column, 'strategy': strategy, 'missing': int(missing),
+                            'seconds': time.perf_counter() - start, **details})
+
+    def fit_transform(self, frame):
+        """Imputed float64 copy of frame; columns that are entirely NaN are dropped, like sklearn's imputers"""
+        self.report = []
+        frame = frame.astype(float)
+        missing = frame.isna()
+        counts = missing.sum()
+        self.dropped = [column for column in frame.columns if counts[column] == len(frame)]
+        frame = frame.drop(columns=self.dropped)
+
+        neighbour_columns = []
+        for column in frame.columns:
+            start = time.perf_counter()
+            if not counts[column]:
+                continue
+            fill = known_fill(column)
+            if fill is not None:
+                frame[column] = frame[column].fillna(fill)
+                self._record(column, 'known', counts[column], start, value=fill)
+            else:
+                neighbour_columns.append(column)
+
+        # Columns missing on exactly the same rows (e.g. RTT and everything derived from it) share a search
+        groups = {}
+        for column in neighbour_columns:
+            groups.setdefault(missing[column].to_numpy().tobytes(), []).append(column)
+        complete = [column for column in frame.columns if column not in neighbour_columns]
+        for columns in groups.values():
+            self._impute_group(frame, columns, complete, missing[columns[0]].to_numpy())
+        return frame
+
+    def _fill_median(self, frame, columns, rows, start, reason):
+        for column in columns:
+            frame.loc[rows, column] = frame[column].median()
+            self._record(column, 'median', rows.sum(), start, reason=reason)
+            start = time.perf_counter()
+
+    def _impute_group(self, frame, columns, complete, rows):
+        start = time.perf_counter()
+        donors = np.flatnonzero(~rows)
+        if len(donors) < self.n_neighbors or not complete:
+            self._fill_median(frame, columns, rows, start, 'too few donors or predictors')
+            return
+        rng = np.random.default_rng(self.seed)
+        if len(donors) > self.max_donors:
+            donors = np.sort(rng.choice(donors, self.max_donors, replace=False))
+
+        # Predictors: the complete columns that track the group best on (a sample of) the donors
+        probe = donors if len(donors) <= 20000 else rng.choice(donors, 20000, replace=False)
+        sampled = frame[columns].to_numpy()[probe]
+        candidates = frame[complete].to_numpy()[probe]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            correlation = np.abs(np.corrcoef(candidates, sampled, rowvar=False)[:len(complete), len(complete):])
+        strength = np.nan_to_num(correlation).mean(axis=1)
+        # A predictor that is constant on the rows being imputed cannot tell them apart, and is
+        # usually a fill artifact (e.g. a bucket of the missing column itself), so it is skipped
+        missing_rows = np.flatnonzero(rows)
+        probe_missing = missing_rows if len(missing_rows) <= 20000 else rng.choice(missing_rows, 20000, replace=False)
+        strength[frame[complete].to_numpy()[probe_missing].std(axis=0) == 0] = 0.0
+        order = [i for i in np.argsort(-strength)[:self.max_predictors] if strength[i] >= self.min_correlation]
+        if not order:
+            self._fill_median(frame, columns, rows, start, 'no correlated predictors')
+            return
+        predictors = [complete[i] for i in order]
+
+        X = frame[predictors].to_numpy()
+        center = X[donors].mean(axis=0)
+        scale = X[donors].std(axis=0)
+        scale[scale == 0] = 1.0
+        X = (X - center) / scale
+        tree = KDTree(X[donors])
+        values = frame[columns].to_numpy()[donors]
+
+        targets = missing_rows
+        imputed = np.empty((len(targets), len(columns)))
+        k = min(self.n_neighbors, len(donors))
+        for offset in range(0, len(targets), self.chunk_size):
+            batch = targets[offset:offset + self.chunk_size]
+            _, neighbours = tree.query(X[batch], k=k)
+            imputed[offset:offset + len(batch)] = values[neighbours].mean(axis=1)
+
+        for i, column in enumerate(columns):
+            frame.iloc[targets, frame.columns.get_loc(column)] = imputed[:, i]
+            # The search is shared by the group, so its time is counted once, on the first column
+            self._record(column, 'knn', len(targets), start, predictors=predictors, group=columns[0])
+            start = time.perf_counter()
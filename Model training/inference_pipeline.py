@@ -0,0 +1,137 @@
+# Fused scaler + model inference object for serving
+# Folds the fitted scaler into one precomputed affine step (or straight into the
+# weights of linear models), owns the input column order and returns
+# predictions and probabilities from a single model evaluation
+
+import numpy as np
+
+# Classifiers whose predict() is the argmax of predict_proba()
+ARGMAX_CLASSIFIERS = (
+    'LogisticRegression', 'RandomForestClassifier', 'ExtraTreesClassifier',
+    'GradientBoostingClassifier', 'DecisionTreeClassifier', 'FlatTreeClassifier',
+)
+
+LINEAR_REGRESSORS = ('LinearRegression', 'Ridge', 'Lasso', 'ElasticNet')
+
+# libsvm estimators write into their fitted arrays at predict time, so they cannot
+# run on read-only memory maps
+LIBSVM_MODELS = ('SVC', 'NuSVC', 'SVR', 'NuSVR', 'OneClassSVM')
+
+
+def needs_writable_arrays(obj):
+    """True if obj (a model or a pipeline wrapping one) must not be memory-mapped read-only"""
+    model = obj.model if isinstance(obj, FusedPipeline) else obj
+    return type(model).__name__ in LIBSVM_MODELS
+
+
+def affine_params(scaler):
+    """(scale, offset) such that scaler.transform(X) == X * scale + offset, or None"""
+    name = type(scaler).__name__
+
+    # Only the default configurations are folded; a scaler that skips centering or
+    # scaling still has mean_ / center_ set, so anything else keeps scaler.transform
+    if name == 'StandardScaler':
+        if not (scaler.with_mean and scaler.with_std):
+            return None
+        scale = 1.0 / scaler.scale_
+        return np.asarray(scale, dtype=float), np.asarray(-scaler.mean_ * scale, dtype=float)
+
+    if name == 'RobustScaler':
+        if not (scaler.with_centering and scaler.with_scaling):
+            return None
+        scale = 1.0 / scaler.scale_
+        return np.asarray(scale, dtype=float), np.asarray(-scaler.center_ * scale, dtype=float)
+
+    if name == 'MinMaxScaler' and not getattr(scaler, 'clip', False):
+        return np.asarray(scaler.scale_, dtype=float), np.asarray(scaler.min_, dtype=float)
+
+    # PowerTransformer and friends are not affine
+    return None
+
+
+class FusedPipeline:
+    """Feature order, scaling and model evaluation in one object"""
+
+    def __init__(self, features, scaler, model):
+        self.features = list(features)
+        self.n_features_in_ = len(self.features)
+        self.classes_ = getattr(model, 'classes_', None)
+        self.is_classifier = hasattr(model, 'predict_proba')
+        self.model_type = type(model).__name__
+
+        params = affine_params(scaler) if scaler is not None else (
+            np.ones(self.n_features_in_), np.zeros(self.n_features_in_)
+        )
+        self.scaler = scaler if params is None else None
+        self.scale, self.offset = params if params is not None else (None, None)
+
+        # Linear models absorb the affine step: w.(x*s + o) + b == (w*s).x + (w.o + b)
+        self.kind = 'model'
+        self.coef = None
+        self.intercept = None
+        if params is not None:
+            self._fold_linear(model)
+
+        # Folded models no longer need the estimator at serve time
+        self.model = None if self.kind != 'model' else model
+
+    def _fold_linear(self, model):
+        coef = getattr(model, 'coef_', None)
+        if coef is None:
+            return
+        coef = np.asarray(coef, dtype=float)
+
+        if self.model_type in LINEAR_REGRESSORS and coef.ndim == 1:
+            self.kind = 'linear'
+            intercept = float(np.ravel(model.intercept_)[0]) if np.ndim(model.intercept_) else float(model.intercept_)
+        elif self.model_type == 'LogisticRegression' and coef.shape[0] == 1 and len(self.classes_) == 2:
+            self.kind = 'logistic'
+            coef = coef[0]
+            intercept = float(model.intercept_[0])
+        else:
+            return
+
+        self.coef = coef * self.scale
+        self.intercept = intercept + float(coef @ self.offset)
+
+    def transform(self, X):
+        """Apply the scaling step"""
+        X = np.asarray(X, dtype=float)
+        if self.scaler is not None:
+            return self.scaler.transform(X)
+        return X * self.scale + self.offset
+
+    def predict_and_proba(self, X):
+        """Predictions and class probabilities (None for regressors) from one evaluation"""
+        X = np.asarray(X, dtype=float)
+
+        if self.kind == 'linear':
+            return X @ self.coef + self.intercept, None
+
+        if self.kind == 'logistic':
+            decision = X @ self.coef + self.intercept
+            positive = 1.0 / (1.0 + np.exp(-decision))
+            return self.classes_[(decision > 0).astype(int)], np.column_stack([1.0 - positive, positive])
+
+        X_scaled = self.transform(X)
+        if hasattr(self.model, 'predict_and_proba'):
+            return self.model.predict_and_proba(X_scaled)
+        if not self.is_classifier:
+            return self.model.predict(X_scaled), None
+
+        proba = self.model.predict_proba(X_scaled)
+        if self.model_type in ARGMAX_CLASSIFIERS:
+            return self.classes_[np.argmax(proba, axis=1)], proba
+        # e.g. SVC with Platt scaling, where predict and predict_proba can disagree
+        return self.model.predict(X_scaled), proba
+
+    def predict(self, X):
+        return self.predict_and_proba(X)[0]
+
+    def feature_vector(self, record):
+        """Single feature row from a dict, missing features default to 0"""
+        return np.array([record[f] if f in record else 0 for f in self.features], dtype=float)
+
+    def feature_matrix(self, frame):
+        """Feature matrix in this pipeline's column order, missing values default to 0"""
+        return frame.reindex(columns=self.features, fill_value=0).fillna(0).to_numpy(dtype=float)
@@ -0,0 +1,141 @@
+# In-process latency histograms and counters with Prometheus text output
+# Fixed log-spaced buckets: recording a sample is a bisect and two additions,
+# with no per-request allocation
+
+import threading
+from bisect import bisect_left
+
+# Bucket upper bounds in seconds: 10us to ~84s, each sqrt(2) wider than the last
+BUCKET_BOUNDS = tuple(1e-5 * 2 ** (i / 2) for i in range(47))
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def quantile(counts, q):
+    """Estimated quantile of bucket counts, interpolated inside the bucket that contains it"""
+    total = sum(counts)
+    if total == 0:
+        return 0.0
+
+    rank = q * total
+    seen = 0
+    for index, bucket_count in enumerate(counts):
+        if bucket_count and seen + bucket_count >= rank:
+            lower = BUCKET_BOUNDS[index - 1] if index > 0 else 0.0
+            upper = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else BUCKET_BOUNDS[-1]
+            return lower + (upper - lower) * (rank - seen) / bucket_count
+        seen += bucket_count
+    return BUCKET_BOUNDS[-1]
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self):
+        # Last slot counts samples above the largest bound
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect_left(BUCKET_BOUNDS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += seconds
+            self.count += 1
+
+    def snapshot(self):
+        """Consistent copy of (bucket counts, sum, count)"""
+        with self._lock:
+            return list(self.counts), self.total, self.count
+
+    def quantile(self, q):
+        return quantile(self.snapshot()[0], q)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class Metrics:
+    """Named histograms, counters and gauges keyed by label tuples"""
+
+    def __init__(self, prefix='dashboard'):
+        self.prefix = prefix
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, labels=()):
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, LatencyHistogram())
+        return histogram
+
+    def observe(self, name, labels, seconds):
+        self.histogram(name, labels).observe(seconds)
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name, callback):
+        """Register a callback returning {labels: value}, evaluated at scrape time"""
+        with self._lock:
+            self._gauges[name] = callback
+
+    def render_prometheus(self):
+        """Prometheus text exposition format"""
+        # Copy under the lock writers take, then render without holding it
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+
+        lines = []
+        by_name = {}
+        for (name, labels), histogram in histograms:
+            by_name.setdefault(name, []).append((labels, histogram.snapshot()))
+
+        for name, series in by_name.items():
+            metric = f'{self.prefix}_{name}'
+            lines.append(f'# TYPE {metric} histogram')
+            for labels, (counts, total, count) in series:
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKET_BOUNDS, counts):
+                    cumulative += bucket_count
+                    bucket_labels = format_labels(labels + (('le', f'{bound:.6g}'),))
+                    lines.append(f'{metric}_bucket{bucket_labels} {cumulative}')
+                lines.append(f'{metric}_bucket{format_labels(labels + (("le", "+Inf"),))} {count}')
+                lines.append(f'{metric}_sum{format_labels(labels)} {total:.9f}')
+                lines.append(f'{metric}_count{format_labels(labels)} {count}')
+
+            lines.append(f'# TYPE {metric}_quantile gauge')
+            for labels, (counts, _, _) in series:
+                for q in QUANTILES:
+                    quantile_labels = format_labels(labels + (('quantile', f'{q:g}'),))
+                    lines.append(f'{metric}_quantile{quantile_labels} {quantile(counts, q):.9f}')
+
+        counter_names = {}
+        for (name, labels), value in counters:
+            counter_names.setdefault(name, []).append((labels, value))
+        for name, series in counter_names.items():
+            metric = f'{self.prefix}_{name}'
+            lines.append(f'# TYPE {metric} counter')
+            for labels, value in series:
+                lines.append(f'{metric}{format_labels(labels)} {value}')
+
+        for name, callback in gauges:
+            metric = f'{self.prefix}_{name}'
+            lines.append(f'# TYPE {metric} gauge')
+            for labels, value in sorted(callback().items()):
+                lines.append(f'{metric}{format_labels(labels)} {value}')
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,141 @@
+# Micro-batching for single-row prediction requests
+# Merges concurrent requests for the same model into one scaler/model call
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """Queue single rows and score them together in small batches"""
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=2.0, name='model'):
+        # predict_fn takes a 2D array and returns (predictions, probabilities or None)
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+        self._closed = False
+
+        # Simple counters for monitoring
+        self.batches_processed = 0
+        self.rows_processed = 0
+
+    @property
+    def queue_depth(self):
+        """Number of rows waiting to be scored"""
+        return self._queue.qsize()
+
+    def _ensure_worker(self):
+        """Start the worker thread lazily (and again after a fork)"""
+        pid = os.getpid()
+        if self._closed:
+            return
+        if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._closed or (self._worker is not None and self._worker_pid == pid and self._worker.is_alive()):
+                return
+            if self._worker_pid != pid:
+                # Threads do not survive fork, so drop anything queued by the parent
+                self._queue = queue.Queue()
+            self._worker = threading.Thread(
+                target=self._run, name=f'micro-batcher-{self.name}', daemon=True
+            )
+            self._worker_pid = pid
+            self._worker.start()
+
+    def start(self):
+        """Start the worker thread now rather than on the first submitted row"""
+        self._ensure_worker()
+
+    def submit(self, row):
+        """Queue one feature row, returns a Future of (prediction, probability)"""
+        row = np.asarray(row, dtype=float).ravel()
+        future = Future()
+        self._ensure_worker()
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._queue.put((row, future))
+        if closed:
+            # A request still holding a replaced model is scored on its own thread
+            self._process([(row, future)])
+        return future
+
+    def close(self):
+        """Stop the worker thread once the rows already queued have been scored"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._worker is not None and self._worker_pid == os.getpid():
+                self._queue.put(None)
+
+    def predict(self, row, timeout=None):
+        """Score one feature row and wait for its result"""
+        return self.submit(row).result(timeout=timeout)
+
+    def _collect_batch(self):
+        """Block for the first row, then gather more until size or time limit.
+
+        Returns the batch and whether close() was called.
+        """
+        item = self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # Take whatever is already waiting without blocking
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+
+        return batch, False
+
+    def _run(self):
+        while True:
+            batch, closed = self._collect_batch()
+            self._process(batch)
+            if closed:
+                return
+
+    def _process(self, batch):
+        # Skip callers that gave up before we got to them
+        batch = [(row, future) for row, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        try:
+            X = np.vstack([row for row, _ in batch])
+            predictions, probabilities = self.predict_fn(X)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for i, (_, future) in enumerate(batch):
+            probability = probabilities[i] if probabilities is not None else None
+            future.set_result((predictions[i], probability))
+
+        self.batches_processed += 1
+        self.rows_processed += len(batch)
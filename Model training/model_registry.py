@@ -0,0 +1,356 @@
+# Model registry for the dashboard server
+# Finds models/<name>_{model,scaler,selector,features}.pkl bundles (or a single
+# models/<name>_serving.bin export, used only when it was made from the current
+# pickles), loads them lazily on first use and swaps
+# in new versions when the files change on disk. Training writes
+# models/<name>_version.json last, so when it exists only that file is watched
+# and a bundle is never loaded while its parts are still being written.
+# Warm-up runs outside the load lock: a first load is published cold and warmed
+# in the background, and a new version is loaded and warmed in the background
+# while the current one keeps serving
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from inference_pipeline import FusedPipeline, needs_writable_arrays
+from serving_format import load_pipeline, read_header
+from tree_engine import FlatTreeEnsemble
+
+# Files that make up a bundle (selector, compiled tree engine and fused pipeline are optional)
+BUNDLE_PARTS = ('model', 'scaler', 'selector', 'features', 'engine', 'pipeline')
+REQUIRED_PARTS = ('model', 'scaler', 'features')
+
+
+class ModelBundle:
+    """One loaded version of a model and its preprocessing artifacts"""
+
+    def __init__(self, name, model, scaler, selector, features, mtime, engine=None, pipeline=None):
+        self.name = name
+        self.model = model
+        self.engine = engine
+        self.scaler = scaler
+        self.selector = selector
+        # Serving goes through one fused object that owns the column order
+        self.pipeline = pipeline if pipeline is not None else FusedPipeline(features, scaler, self.predictor)
+        self.features = self.pipeline.features
+        self.mtime = mtime
+        self.version = datetime.fromtimestamp(mtime).strftime('%Y%m%d%H%M%S')
+        self.loaded_at = datetime.now().isoformat()
+        self.last_used = time.time()
+        # Warm-up timings (or its error), set once warmed is
+        self.warmup = None
+        self.warmed = threading.Event()
+
+    @property
+    def predictor(self):
+        """Flat tree engine when one was exported, otherwise the sklearn model"""
+        return self.engine if self.engine is not None else self.model
+
+    @property
+    def uses_engine(self):
+        """True if requests are scored by a flat tree engine, wherever it was loaded from"""
+        return isinstance(self.pipeline.model, FlatTreeEnsemble) or self.engine is not None
+
+
+class ModelRegistry:
+    """Lazy-loading, hot-reloading store of model bundles"""
+
+    def __init__(self, model_dir='models', check_interval=2.0, idle_timeout=0, on_load=None, on_unload=None,
+                 warm_up=None, mmap_mode='c'):
+        self.model_dir = model_dir
+        # Memory-map numpy arrays from uncompressed joblib dumps so every worker
+        # process shares one page-cache copy instead of holding its own; 'c' is
+        # copy-on-write, so models that write to their arrays still work
+        self.mmap_mode = mmap_mode or None
+        # Seconds between mtime checks for an already loaded bundle
+        self.check_interval = check_interval
+        # Unload bundles unused for this many seconds (0 keeps them forever)
+        self.idle_timeout = idle_timeout
+        # Called with each freshly loaded bundle before it is published
+        self.on_load = on_load
+        # Called with a bundle once it is replaced or unloaded (in-flight requests may still hold it)
+        self.on_unload = on_unload
+        # Called with each loaded bundle outside the load lock, returns its warm-up timings
+        self.warm_up = warm_up
+
+        self._bundles = {}
+        self._last_checked = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._reloading = set()
+
+    def path(self, name, part):
+        return os.path.join(self.model_dir, f'{name}_{part}.pkl')
+
+    def serving_path(self, name):
+        return os.path.join(self.model_dir, f'{name}_serving.bin')
+
+    def manifest_path(self, name):
+        return os.path.join(self.model_dir, f'{name}_version.json')
+
+    def read_manifest(self, name):
+        """The version manifest written after a bundle's parts, or None for bundles without one"""
+        try:
+            with open(self.manifest_path(name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def discover(self):
+        """List bundle names that have all required files on disk"""
+        if not os.path.isdir(self.model_dir):
+            return []
+        names = set()
+        for filename in os.listdir(self.model_dir):
+            if filename.endswith('_serving.bin'):
+                names.add(filename[:-len('_serving.bin')])
+            elif filename.endswith('_model.pkl'):
+                name = filename[:-len('_model.pkl')]
+                if all(os.path.exists(self.path(name, part)) for part in REQUIRED_PARTS):
+                    names.add(name)
+        return sorted(names)
+
+    def _bundle_mtime(self, name):
+        """mtime that identifies the bundle version on disk, or None if a required file is missing"""
+        try:
+            # Written last and atomically: a new mtime means every part is in place
+            manifest_mtime = os.stat(self.manifest_path(name)).st_mtime
+        except FileNotFoundError:
+            manifest_mtime = None
+        if manifest_mtime is not None:
+            complete = os.path.exists(self.serving_path(name)) or all(
+                os.path.exists(self.path(name, part)) for part in REQUIRED_PARTS)
+            return manifest_mtime if complete else None
+
+        # Bundles copied in by hand have no manifest: fall back to the newest part
+        if self.serving_is_current(name):
+            # A current serving export is the whole bundle on its own
+            return os.stat(self.serving_path(name)).st_mtime
+        mtimes = []
+        for part in BUNDLE_PARTS:
+            try:
+                mtimes.append(os.stat(self.path(name, part)).st_mtime)
+            except FileNotFoundError:
+                if part in REQUIRED_PARTS:
+                    return None
+        return max(mtimes)
+
+    def serving_is_current(self, name):
+        """True if the serving export exists and was made from the bundle's current pickles.
+
+        With a manifest, the export must carry the manifest's version; without one,
+        it must be at least as new as every pickle. A stale export is ignored.
+        """
+        try:
+            serving_mtime = os.stat(self.serving_path(name)).st_mtime
+        except FileNotFoundError:
+            return False
+        manifest = self.read_manifest(name)
+        if manifest is not None:
+            try:
+                header = read_header(self.serving_path(name))[0]
+            except (OSError, ValueError):
+                return False
+            return header.get('source_version') == manifest.get('version')
+        pickle_mtimes = [
+            os.stat(self.path(name, part)).st_mtime
+            for part in BUNDLE_PARTS if os.path.exists(self.path(name, part))
+        ]
+        return not pickle_mtimes or serving_mtime >= max(pickle_mtimes)
+
+    def load_artifact(self, path):
+        """Load one pickle, memory-mapping its arrays when possible"""
+        # Imported here so servers running serving exports never load joblib
+        import joblib
+        # joblib ignores mmap_mode for compressed dumps and falls back to a private copy
+        artifact = joblib.load(path, mmap_mode=self.mmap_mode)
+        if self.mmap_mode == 'r' and needs_writable_arrays(artifact):
+            # libsvm fails on read-only buffers: load this one into private memory
+            artifact = joblib.load(path)
+        return artifact
+
+    def _load_bundle(self, name, mtime):
+        serving_path = self.serving_path(name)
+        pipeline_path = self.path(name, 'pipeline')
+        use_serving = self.serving_is_current(name)
+        if not use_serving and os.path.exists(serving_path):
+            print(f"⚠️ {serving_path} was not exported from the current {name} pickles, ignoring it")
+        if use_serving:
+            # NumPy-only export: no unpickling and no sklearn import
+            pipeline = load_pipeline(serving_path, self.mmap_mode)
+            bundle = ModelBundle(
+                name, model=None, scaler=None, selector=None,
+                features=pipeline.features, mtime=mtime, pipeline=pipeline,
+            )
+        elif os.path.exists(pipeline_path):
+            # The fused pipeline carries everything needed to serve
+            bundle = ModelBundle(
+                name, model=None, scaler=None, selector=None,
+                features=self.load_artifact(self.path(name, 'features')),
+                mtime=mtime,
+                pipeline=self.load_artifact(pipeline_path),
+            )
+        else:
+            selector_path = self.path(name, 'selector')
+            engine_path = self.path(name, 'engine')
+            bundle = ModelBundle(
+                name,
+                model=self.load_artifact(self.path(name, 'model')),
+                scaler=self.load_artifact(self.path(name, 'scaler')),
+                selector=self.load_artifact(selector_path) if os.path.exists(selector_path) else None,
+                features=self.load_artifact(self.path(name, 'features')),
+                mtime=mtime,
+                engine=self.load_artifact(engine_path) if os.path.exists(engine_path) else None,
+            )
+        if self.on_load is not None:
+            self.on_load(bundle)
+        return bundle
+
+    def _load_lock(self, name):
+        with self._lock:
+            return self._load_locks.setdefault(name, threading.Lock())
+
+    def _warm(self, bundle):
+        try:
+            if self.warm_up is not None:
+                bundle.warmup = self.warm_up(bundle)
+        except Exception as e:
+            bundle.warmup = {'error': str(e)}
+            print(f"❌ Error warming up {bundle.name} model: {e}")
+        finally:
+            bundle.warmed.set()
+
+    def _warm_in_background(self, bundle):
+        if self.warm_up is None:
+            bundle.warmed.set()
+            return
+        threading.Thread(target=self._warm, args=(bundle,), name=f'warmup-{bundle.name}', daemon=True).start()
+
+    def _reload(self, name, mtime):
+        """Load and warm a new version, then swap it in; runs on its own thread"""
+        try:
+            try:
+                new_bundle = self._load_bundle(name, mtime)
+            except Exception as e:
+                # A broken artifact should not take down the current version
+                self._errors[name] = str(e)
+                print(f"❌ Error loading {name} model: {e}")
+                return
+            self._warm(new_bundle)
+
+            with self._load_lock(name):
+                # Atomic swap: in-flight requests keep their reference to the old bundle
+                bundle = self._bundles.get(name)
+                self._bundles[name] = new_bundle
+                self._errors.pop(name, None)
+            print(f"✅ {name} model reloaded (version {new_bundle.version})")
+            if bundle is not None and self.on_unload is not None:
+                self.on_unload(bundle)
+        finally:
+            with self._lock:
+                self._reloading.discard(name)
+
+    def get(self, name):
+        """Return the current bundle for a name, loading it if needed.
+
+        A first load blocks until the model is loaded (not warmed); a new version
+        on disk is loaded in the background and this returns the current one.
+        """
+        now = time.time()
+        bundle = self._bundles.get(name)
+
+        if bundle is not None and now - self._last_checked.get(name, 0) < self.check_interval:
+            bundle.last_used = now
+            self._evict_idle(now)
+            return bundle
+
+        loaded = None
+        with self._load_lock(name):
+            # Another thread may have loaded it while we waited
+            bundle = self._bundles.get(name)
+            mtime = self._bundle_mtime(name)
+            self._last_checked[name] = now
+
+            if mtime is None:
+                # Files removed: keep serving what we have, if anything
+                if bundle is None:
+                    self._errors[name] = 'Model files not found'
+                return bundle
+
+            if bundle is not None and mtime != bundle.mtime:
+                with self._lock:
+                    start = name not in self._reloading
+                    self._reloading.add(name)
+                if start:
+                    threading.Thread(target=self._reload, args=(name, mtime),
+                                     name=f'reload-{name}', daemon=True).start()
+            elif bundle is None:
+                try:
+                    bundle = loaded = self._load_bundle(name, mtime)
+                except Exception as e:
+                    self._errors[name] = str(e)
+                    print(f"❌ Error loading {name} model: {e}")
+                    return None
+                self._bundles[name] = bundle
+                self._errors.pop(name, None)
+                print(f"✅ {name} model loaded (version {bundle.version})")
+
+        if loaded is not None:
+            self._warm_in_background(loaded)
+        bundle.last_used = now
+        self._evict_idle(now)
+        return bundle
+
+    def features(self, name):
+        """Feature list for a bundle without loading the model itself"""
+        bundle = self._bundles.get(name)
+        if bundle is not None:
+            return bundle.features
+        try:
+            if self.serving_is_current(name):
+                return list(read_header(self.serving_path(name))[0]['features'])
+            return list(self.load_artifact(self.path(name, 'features')))
+        except Exception:
+            return None
+
+    def loaded(self):
+        """Snapshot of the bundles currently in memory"""
+        return dict(self._bundles)
+
+    def is_loaded(self, name):
+        return name in self._bundles
+
+    def unload(self, name):
+        """Drop a bundle from memory; it is loaded again on next use"""
+        with self._load_lock(name):
+            bundle = self._bundles.pop(name, None)
+            self._last_checked.pop(name, None)
+        if bundle is not None and self.on_unload is not None:
+            self.on_unload(bundle)
+
+    def _evict_idle(self, now):
+        if not self.idle_timeout:
+            return
+        for name, bundle in list(self._bundles.items()):
+            if now - bundle.last_used > self.idle_timeout:
+                self.unload(name)
+                print(f"💤 {name} model unloaded after {self.idle_timeout}s idle")
+
+    def versions(self):
+        """Loaded version and status of every bundle on disk or in memory"""
+        info = {}
+        for name in sorted(set(self.discover()) | set(self._bundles)):
+            bundle = self._bundles.get(name)
+            info[name] = {
+                'loaded': bundle is not None,
+                'version': bundle.version if bundle is not None else None,
+                'loaded_at': bundle.loaded_at if bundle is not None else None,
+                'engine': bundle is not None and bundle.uses_engine,
+                'pipeline': bundle.pipeline.kind if bundle is not None else None,
+                'error': self._errors.get(name),
+            }
+        return info
@@ -0,0 +1,118 @@
+# Token-bucket rate limiting for the dashboard API
+# Constant-time checks per request, idle buckets are evicted, and an optional
+# SQLite store shares the limits between worker processes
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+
+# Least recently used buckets checked for eviction per request
+EVICT_SCAN = 8
+
+
+def take_token(tokens, updated, now, rate, capacity):
+    """Refill a bucket and try to take one token.
+
+    Returns (allowed, tokens_left, retry_after_seconds).
+    """
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / rate
+
+
+class MemoryBucketStore:
+    """Per-process buckets in an LRU dict"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, capacity):
+        now = time.time()
+        with self._lock:
+            tokens, updated, _ = self._buckets.pop(key, (capacity, now, now))
+            allowed, tokens, retry_after = take_token(tokens, updated, now, rate, capacity)
+            # Time at which this bucket is full again and can be forgotten
+            full_at = now + (capacity - tokens) / rate
+            self._buckets[key] = (tokens, now, full_at)
+            self._evict(now)
+        return allowed, retry_after
+
+    def _evict(self, now):
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        # Drop buckets that have refilled completely among the least recently used
+        # few, since a missing bucket behaves exactly like a full one. Looking past
+        # the first means a throttled key there does not hold up the ones behind it
+        expired = [
+            key for key, (_, _, full_at) in islice(self._buckets.items(), EVICT_SCAN)
+            if full_at <= now
+        ]
+        for key in expired:
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBucketStore:
+    """Buckets in a local SQLite file, shared by every worker on the host"""
+
+    def __init__(self, path, cleanup_interval=60):
+        self.path = path
+        self.cleanup_interval = cleanup_interval
+        self._local = threading.local()
+        self._last_cleanup = 0.0
+
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS buckets '
+            '(key TEXT PRIMARY KEY, tokens REAL, updated REAL, full_at REAL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at)')
+
+    def _connection(self):
+        # sqlite3 connections must stay on the thread that created them
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def consume(self, key, rate, capacity):
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row is not None else (capacity, now)
+            allowed, tokens, retry_after = take_token(tokens, updated, now, rate, capacity)
+            conn.execute(
+                'INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)',
+                (key, tokens, now, now + (capacity - tokens) / rate)
+            )
+            if now - self._last_cleanup > self.cleanup_interval:
+                self._last_cleanup = now
+                conn.execute('DELETE FROM buckets WHERE full_at < ?', (now,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, retry_after
+
+
+def create_bucket_store(url):
+    """Build a store from 'memory' or 'sqlite:///path/to/file.db'"""
+    if not url or url == 'memory':
+        return MemoryBucketStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteBucketStore(url[len('sqlite:///'):])
+    raise ValueError(f'Unknown rate limit backend: {url}')
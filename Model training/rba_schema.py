@@ -0,0 +1,45 @@
+# Declared read schema for the RBA login dataset (login/rba-dataset.csv)
+# Only the columns training uses are read. Low-cardinality strings become
+# categoricals, numbers are read at the smallest width that holds the
+# dataset's documented ranges, and Login Timestamp is parsed while reading,
+# instead of pandas inferring int64 / float64 / object for every column.
+
+try:
+    import pyarrow  # noqa: F401
+
+    # Millions of distinct IPs: Arrow strings are far smaller than Python objects
+    IP_DTYPE = 'string[pyarrow]'
+except ImportError:
+    IP_DTYPE = object
+
+# Strings with at most a few thousand distinct values
+CATEGORY_COLUMNS = ('Country', 'Region', 'City', 'Browser Name and Version', 'OS Name and Version', 'Device Type')
+
+DATE_COLUMNS = ('Login Timestamp',)
+
+RBA_DTYPES = {
+    'index': 'int32',
+    'User ID': 'int64',  # 64-bit random pseudonyms
+    'IP Address': IP_DTYPE,
+    'ASN': 'uint32',  # 0 - 600000
+    # Mostly empty and up to 8.6M ms: needs a float for NaN, float32 is exact below 2^24
+    'Round-Trip Time [ms]': 'float32',
+    'Login Successful': 'bool',
+    'Is Attack IP': 'bool',
+    'Is Account Takeover': 'bool',
+    **{name: 'category' for name in CATEGORY_COLUMNS},
+}
+
+# Read and kept; everything else in the file (e.g. User Agent String) is skipped
+RBA_COLUMNS = frozenset(RBA_DTYPES) | frozenset(DATE_COLUMNS)
+
+
+def read_options():
+    """Keyword arguments for pd.read_csv that apply the schema"""
+    return {
+        # A callable tolerates columns missing from older exports of the dataset
+        'usecols': lambda name: name in RBA_COLUMNS,
+        'dtype': RBA_DTYPES,
+        'parse_dates': list(DATE_COLUMNS),
+    }
+
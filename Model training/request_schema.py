@@ -0,0 +1,82 @@
+# Compiled request schemas for the single-row prediction routes
+# Each model's feature list becomes a name -> column table; a request body is
+# decoded once and written straight into a float64 row, with type coercion and
+# validation done in the same pass over the fields
+
+import math
+
+import numpy as np
+
+try:
+    import orjson
+
+    decode_json = orjson.loads
+except ImportError:
+    import json
+
+    decode_json = json.loads
+
+
+class SchemaError(Exception):
+    """Request body that does not fit the schema, with one entry per bad field"""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(f"{e['field']}: {e['error']}" if e['field'] else e['error'] for e in errors))
+        self.errors = errors
+
+    def payload(self):
+        return {'success': False, 'error': 'Invalid request', 'errors': self.errors}
+
+
+class RequestSchema:
+    """Feature layout of one model, compiled for building rows from JSON"""
+
+    def __init__(self, features):
+        self.features = tuple(features)
+        self.index = {name: i for i, name in enumerate(self.features)}
+        # Missing (or null) features default to 0, like the bulk and batch routes
+        self._zeros = np.zeros(len(self.features))
+
+    def decode(self, body):
+        try:
+            record = decode_json(body)
+        except ValueError as e:
+            raise SchemaError([{'field': None, 'error': f'Invalid JSON: {e}'}])
+        if not isinstance(record, dict):
+            raise SchemaError([{'field': None, 'error': 'Body must be a JSON object'}])
+        return record
+
+    def row(self, record):
+        """Feature row for a decoded record; unknown fields are ignored"""
+        row = self._zeros.copy()
+        errors = []
+        index = self.index
+        for name, value in record.items():
+            i = index.get(name)
+            if i is None or value is None:
+                continue
+            kind = type(value)
+            if kind is float or kind is int or kind is bool:
+                number = value
+            elif kind is str:
+                try:
+                    number = float(value)
+                except ValueError:
+                    errors.append({'field': name, 'error': f'Expected a number, got {value!r}'})
+                    continue
+            else:
+                errors.append({'field': name, 'error': f'Expected a number, got {kind.__name__}'})
+                continue
+            try:
+                row[i] = number
+            except OverflowError:
+                # Integers too large for a float64
+                row[i] = math.inf
+            if not math.isfinite(row[i]):
+                errors.append({'field': name, 'error': 'Must be a finite number'})
+        if errors:
+            raise SchemaError(errors)
+        return row
+
+    def parse(self, body):
+        return self.row(self.decode(body))
@@ -0,0 +1,222 @@
+# Single-pass reservoir sampling of large CSV files
+# Every row gets a uniform random key and the rows with the smallest keys are
+# kept, so each row is equally likely to be picked wherever it sits in the file
+# and no row count is needed up front. Once the reservoir is full, a chunk is
+# filtered against the largest key kept so far, and only the few rows that can
+# still get in are buffered; the buffer is pruned back with one argpartition
+# when it reaches twice the reservoir size, so the reservoir is copied a
+# handful of times per file rather than once per chunk.
+
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+
+def concat_frames(frames):
+    """pd.concat that keeps categoricals categorical when the frames saw different values"""
+    frames = [frame for frame in frames if len(frame)] or frames[:1]
+    if len(frames) > 1:
+        for name, dtype in frames[0].dtypes.items():
+            if not isinstance(dtype, pd.CategoricalDtype):
+                continue
+            categories = dtype.categories
+            for frame in frames[1:]:
+                categories = categories.union(frame[name].cat.categories)
+            # Recode only the frames whose categories differ, usually just the newest chunk
+            frames = [
+                frame if frame[name].cat.categories.equals(categories)
+                else frame.assign(**{name: frame[name].cat.set_categories(categories)})
+                for frame in frames
+            ]
+    return pd.concat(frames)
+
+
+def stratum_key(value):
+    """Groupby key as a dict key: every missing value maps to None (NaN != NaN)"""
+    return None if pd.isna(value) else value
+
+
+class KeyReservoir:
+    """The capacity rows with the smallest keys offered so far, pruned in batches"""
+
+    def __init__(self, capacity, on_evict=None):
+        self.capacity = capacity
+        # Called with (keys, positions, rows) of the rows a prune drops
+        self.on_evict = on_evict
+        # Largest key kept at the last prune once full: rows at or above it can never get in
+        self.threshold = np.inf
+        self._keys = []
+        self._positions = []
+        self._rows = []
+        self._buffered = 0
+
+    def offer(self, rows, keys, positions, index=None):
+        """Offer rows (or rows.iloc[index]) with their keys and file positions"""
+        if self.capacity <= 0:
+            return
+        if self.threshold < np.inf:
+            entering = np.flatnonzero(keys < self.threshold)
+            if not len(entering):
+                return
+            keys, positions = keys[entering], positions[entering]
+            index = entering if index is None else index[entering]
+        if index is not None and len(index) < len(rows):
+            # Only rows that can still get in are copied out of the chunk
+            rows = rows.iloc[index]
+        self._keys.append(keys)
+        self._positions.append(positions)
+        self._rows.append(rows)
+        self._buffered += len(keys)
+        if self._buffered >= 2 * self.capacity:
+            self._prune()
+
+    def _prune(self):
+        if len(self._keys) == 1 and self._buffered <= self.capacity:
+            return
+        keys = np.concatenate(self._keys)
+        positions = np.concatenate(self._positions)
+        rows = concat_frames(self._rows)
+        if len(keys) > self.capacity:
+            order = np.argpartition(keys, self.capacity - 1)
+            if self.on_evict is not None:
+                dropped = order[self.capacity:]
+                self.on_evict(keys[dropped], positions[dropped], rows.iloc[dropped])
+            keep = order[:self.capacity]
+            keys, positions, rows = keys[keep], positions[keep], rows.iloc[keep]
+        if len(keys) >= self.capacity:
+            self.threshold = keys.max()
+        self._keys, self._positions, self._rows = [keys], [positions], [rows]
+        self._buffered = len(keys)
+
+    def contents(self):
+        """(keys, file positions, rows) of the reservoir"""
+        if not self._keys:
+            return np.empty(0), np.empty(0, dtype=np.int64), None
+        self._prune()
+        return self._keys[0], self._positions[0], self._rows[0]
+
+
+class ReservoirSampler:
+    """Uniform (or per-stratum) sample of at most sample_size rows from a stream of DataFrame chunks.
+
+    Stratified sampling keeps one reservoir of sample_size rows for the whole
+    file, plus per stratum the min_per_stratum smallest keys among its rows
+    that are not in it, instead of sample_size rows per stratum. A stratum's
+    rows in the shared reservoir are its smallest keys, so together the two
+    hold its c + min_per_stratum smallest keys, c being its share of the
+    shared reservoir: every stratum's sample is uniform within it, and the
+    allocation is met up to sampling noise, with any shortfall taken from the
+    next smallest keys of the other strata.
+    """
+
+    def __init__(self, sample_size, seed=None, stratify=None, min_per_stratum=0):
+        self.sample_size = sample_size
+        self.stratify = stratify
+        self.min_per_stratum = min_per_stratum
+        self.rows_seen = 0
+        self.counts = Counter()
+        self._rng = np.random.default_rng(seed)
+        on_evict = self._offer_minimums if stratify is not None and min_per_stratum else None
+        self._reservoir = KeyReservoir(sample_size, on_evict)
+        # stratum -> min_per_stratum smallest keys among its rows outside the shared reservoir
+        self._minimums = {}
+
+    def add(self, chunk):
+        # Keys are drawn in file order, so the sample does not depend on the chunk size
+        keys = self._rng.random(len(chunk))
+        positions = np.arange(self.rows_seen, self.rows_seen + len(chunk))
+        self.rows_seen += len(chunk)
+        if self.stratify is None:
+            self.counts[None] += len(chunk)
+            self._reservoir.offer(chunk, keys, positions)
+            return
+
+        outside = keys >= self._reservoir.threshold
+        self._reservoir.offer(chunk, keys, positions)
+        groups = chunk.groupby(self.stratify, sort=False, dropna=False, observed=True).indices
+        for stratum, index in groups.items():
+            self.counts[stratum_key(stratum)] += len(index)
+        if self.min_per_stratum and outside.any():
+            self._offer_minimums(keys, positions, chunk, groups, outside)
+
+    def _offer_minimums(self, keys, positions, rows, groups=None, outside=None):
+        """Offer rows kept out of (or dropped from) the shared reservoir to their stratum's minimum"""
+        if groups is None:
+            groups = rows.groupby(self.stratify, sort=False, dropna=False, observed=True).indices
+        for stratum, index in groups.items():
+            if outside is not None:
+                index = index[outside[index]]
+            reservoir = self._minimums.get(stratum_key(stratum))
+            if reservoir is None:
+                reservoir = self._minimums[stratum_key(stratum)] = KeyReservoir(self.min_per_stratum)
+            reservoir.offer(rows, keys[index], positions[index], index)
+
+    def allocation(self):
+        """Rows to take from each stratum: the minimum first, the rest in proportion to its size"""
+        total = sum(self.counts.values())
+        target = min(self.sample_size, total)
+        minimums = {stratum: min(self.min_per_stratum, count) for stratum, count in self.counts.items()}
+        remaining = max(0, target - sum(minimums.values()))
+        spare = {stratum: count - minimums[stratum] for stratum, count in self.counts.items()}
+        spare_total = sum(spare.values())
+        quotas = {stratum: remaining * count / spare_total if spare_total else 0.0 for stratum, count in spare.items()}
+        allocation = {stratum: minimums[stratum] + int(quota) for stratum, quota in quotas.items()}
+        # Hand the rows lost to rounding down to the largest remainders
+        shortfall = target - sum(allocation.values())
+        for stratum in sorted(quotas, key=lambda s: quotas[s] - int(quotas[s]), reverse=True)[:max(0, shortfall)]:
+            allocation[stratum] += 1
+        return allocation
+
+    def _candidates(self):
+        """stratum -> (keys, positions, rows) of every kept row, smallest key first"""
+        keys, positions, rows = self._reservoir.contents()
+        parts = {}
+        if rows is not None:
+            for stratum, index in rows.groupby(self.stratify, sort=False, dropna=False, observed=True).indices.items():
+                parts.setdefault(stratum_key(stratum), []).append((keys[index], positions[index], rows.iloc[index]))
+        for stratum, reservoir in self._minimums.items():
+            kept_keys, kept_positions, kept_rows = reservoir.contents()
+            if kept_rows is not None:
+                parts.setdefault(stratum, []).append((kept_keys, kept_positions, kept_rows))
+
+        candidates = {}
+        for stratum, pieces in parts.items():
+            keys = np.concatenate([piece[0] for piece in pieces])
+            positions = np.concatenate([piece[1] for piece in pieces])
+            rows = concat_frames([piece[2] for piece in pieces])
+            order = np.argsort(keys, kind='stable')
+            candidates[stratum] = (keys[order], positions[order], rows.iloc[order])
+        return candidates
+
+    def sample(self):
+        """The sampled rows in file order, with a fresh index"""
+        if self.stratify is None:
+            keys, positions, rows = self._reservoir.contents()
+            if rows is None:
+                return pd.DataFrame()
+            return rows.iloc[np.argsort(positions, kind='stable')].reset_index(drop=True)
+
+        candidates = self._candidates()
+        if not candidates:
+            return pd.DataFrame()
+        allocation = self.allocation()
+        taken = {stratum: min(allocation.get(stratum, 0), len(keys)) for stratum, (keys, _, _) in candidates.items()}
+        # Strata short of their allocation: the rows go to the smallest remaining keys elsewhere
+        shortfall = sum(allocation.values()) - sum(taken.values())
+        if shortfall > 0:
+            strata = list(candidates)
+            spare_keys = np.concatenate([candidates[stratum][0][taken[stratum]:] for stratum in strata])
+            spare_strata = np.concatenate([np.full(len(candidates[stratum][0]) - taken[stratum], i) for i, stratum in enumerate(strata)])
+            if len(spare_keys) > shortfall:
+                spare_strata = spare_strata[np.argpartition(spare_keys, shortfall - 1)[:shortfall]]
+            for i, extra in enumerate(np.bincount(spare_strata, minlength=len(strata))):
+                taken[strata[i]] += int(extra)
+
+        positions = []
+        frames = []
+        for stratum, (_, kept_positions, rows) in candidates.items():
+            positions.append(kept_positions[:taken[stratum]])
+            frames.append(rows.iloc[:taken[stratum]])
+        order = np.argsort(np.concatenate(positions), kind='stable')
+        return concat_frames(frames).iloc[order].reset_index(drop=True)
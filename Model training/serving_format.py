@@ -0,0 +1,175 @@
+# Dependency-light export of fused serving pipelines
+# A pipeline whose scaler was folded and whose model is either folded (linear /
+# logistic) or a flat tree engine is written as one file: a JSON header and
+# 64-byte aligned raw arrays. Loading needs only NumPy (no pickle, joblib or
+# sklearn), and the arrays are memory-mapped straight from the file.
+
+import json
+import os
+
+import numpy as np
+
+from inference_pipeline import FusedPipeline
+from tree_engine import FlatTreeClassifier, FlatTreeRegressor
+
+MAGIC = b'RBASERV1'
+ALIGNMENT = 64
+
+PIPELINE_ARRAYS = ('scale', 'offset', 'coef', 'classes_')
+ENGINE_ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots', 'tree_output', 'tree_weight', 'baseline')
+ENGINES = {'FlatTreeRegressor': FlatTreeRegressor, 'FlatTreeClassifier': FlatTreeClassifier}
+
+
+def can_export(pipeline):
+    """True if the pipeline can be served without sklearn"""
+    if pipeline.scaler is not None:
+        return False
+    if pipeline.kind == 'model' and type(pipeline.model).__name__ not in ENGINES:
+        return False
+    classes = pipeline.classes_
+    return classes is None or np.asarray(classes).dtype != object
+
+
+def _padding(position):
+    return -position % ALIGNMENT
+
+
+def export_pipeline(pipeline, path, source_version=None):
+    """Write a pipeline in the serving format, returns False if it needs sklearn.
+
+    source_version is the version manifest of the pickles it was made from; the
+    registry serves the file only while that is still the bundle's version.
+    """
+    if not can_export(pipeline):
+        return False
+
+    arrays = {f'pipeline.{name}': getattr(pipeline, name) for name in PIPELINE_ARRAYS}
+    header = {
+        'features': pipeline.features,
+        'kind': pipeline.kind,
+        'model_type': pipeline.model_type,
+        'is_classifier': pipeline.is_classifier,
+        'intercept': pipeline.intercept,
+        'engine': None,
+        'source_version': source_version,
+    }
+    engine = pipeline.model
+    if engine is not None:
+        arrays.update({f'engine.{name}': getattr(engine, name) for name in ENGINE_ARRAYS})
+        arrays['engine.classes_'] = getattr(engine, 'classes_', None)
+        header['engine'] = {
+            'type': type(engine).__name__,
+            'max_depth': int(engine.max_depth),
+            'n_features_in': int(engine.n_features_in_),
+            'link': getattr(engine, 'link', None),
+        }
+
+    # Lay the arrays out back to back, each starting on an aligned offset
+    layout = {}
+    blobs = []
+    position = 0
+    for name, array in arrays.items():
+        if array is None:
+            continue
+        array = np.asarray(array, order='C')
+        position += _padding(position)
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': position}
+        blobs.append((position, array))
+        position += array.nbytes
+    header['arrays'] = layout
+
+    header_bytes = json.dumps(header).encode()
+    data_start = len(MAGIC) + 8 + len(header_bytes)
+    data_start += _padding(data_start)
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, 'little'))
+        f.write(header_bytes)
+        for offset, array in blobs:
+            f.seek(data_start + offset)
+            f.write(array.tobytes())
+        f.truncate(data_start + position)
+    os.replace(tmp_path, path)
+    return True
+
+
+def read_header(path):
+    """Header of a serving file and the offset where its array data starts"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a serving pipeline file')
+        size = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(size))
+    data_start = len(MAGIC) + 8 + size
+    return header, data_start + _padding(data_start)
+
+
+def load_pipeline(path, mmap_mode='r'):
+    """Rebuild a FusedPipeline from a serving file, memory-mapping its arrays"""
+    header, data_start = read_header(path)
+    if mmap_mode:
+        data = np.memmap(path, dtype=np.uint8, mode=mmap_mode, offset=data_start)
+    else:
+        with open(path, 'rb') as f:
+            f.seek(data_start)
+            data = np.frombuffer(f.read(), dtype=np.uint8)
+
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        start = spec['offset']
+        arrays[name] = data[start:start + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+
+    pipeline = FusedPipeline.__new__(FusedPipeline)
+    pipeline.features = list(header['features'])
+    pipeline.n_features_in_ = len(pipeline.features)
+    pipeline.kind = header['kind']
+    pipeline.model_type = header['model_type']
+    pipeline.is_classifier = header['is_classifier']
+    pipeline.intercept = header['intercept']
+    pipeline.scaler = None
+    for name in PIPELINE_ARRAYS:
+        setattr(pipeline, name, arrays.get(f'pipeline.{name}'))
+
+    pipeline.model = None
+    engine_info = header['engine']
+    if engine_info is not None:
+        engine = ENGINES[engine_info['type']].__new__(ENGINES[engine_info['type']])
+        for name in ENGINE_ARRAYS + ('classes_',):
+            setattr(engine, name, arrays.get(f'engine.{name}'))
+        engine.max_depth = engine_info['max_depth']
+        engine.n_features_in_ = engine_info['n_features_in']
+        if engine_info['link'] is not None:
+            engine.link = engine_info['link']
+        pipeline.model = engine
+    return pipeline
+
+
+if __name__ == '__main__':
+    # Export bundles trained before serving files existed: python serving_format.py [models]
+    import sys
+
+    from model_registry import ModelRegistry
+
+    registry = ModelRegistry(sys.argv[1] if len(sys.argv) > 1 else 'models')
+    for name in registry.discover():
+        path = registry.serving_path(name)
+        if registry.serving_is_current(name):
+            print(f"⏭️ {name}: {path} is up to date")
+            continue
+        # Loads the pickles, since any existing export is stale
+        bundle = registry.get(name)
+        manifest = registry.read_manifest(name)
+        source_version = manifest.get('version') if manifest is not None else None
+        if bundle is not None and export_pipeline(bundle.pipeline, path, source_version):
+            if manifest is not None:
+                # Servers watch the manifest: touching it makes them switch to the export
+                os.utime(registry.manifest_path(name))
+            print(f"✅ {name}: exported to {path}")
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            print(f"❌ {name}: needs sklearn to serve, keeping the pickles")
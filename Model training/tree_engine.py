@@ -0,0 +1,182 @@
+# Flat NumPy inference engine for tree ensembles
+# Compiles fitted RandomForest / GradientBoosting models into contiguous
+# feature/threshold/left/right/value arrays and scores whole batches with
+# vectorized traversal instead of sklearn's per-call validation and dispatch
+
+import numpy as np
+
+
+class FlatTreeEnsemble:
+    """All trees of an ensemble flattened into shared node arrays"""
+
+    def __init__(self, feature, threshold, left, right, value, roots, tree_output,
+                 tree_weight, baseline, max_depth, n_features_in):
+        # Per-node arrays, concatenated over every tree
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        # Root node index of each tree and the output column it adds to
+        self.roots = roots
+        self.tree_output = tree_output
+        self.tree_weight = tree_weight
+        self.baseline = baseline
+        self.max_depth = max_depth
+        self.n_features_in_ = n_features_in
+
+    def apply(self, X):
+        """Leaf node index reached by every sample in every tree, shape (n_samples, n_trees)"""
+        # sklearn compares float32 inputs against the split thresholds
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], len(self.roots)))
+
+        # Leaves point at themselves, so a fixed number of steps reaches every leaf
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def raw_predict(self, X):
+        """Weighted sum of leaf values per output column"""
+        leaf_values = self.value[self.apply(X)] * self.tree_weight
+        raw = np.zeros((leaf_values.shape[0],) + self.baseline.shape)
+        if raw.ndim == 2 and leaf_values.ndim == 2:
+            # One output column per tree (gradient boosting)
+            for k in range(raw.shape[1]):
+                raw[:, k] = leaf_values[:, self.tree_output == k].sum(axis=1)
+        else:
+            raw += leaf_values.sum(axis=1)
+        return raw + self.baseline
+
+
+class FlatTreeRegressor(FlatTreeEnsemble):
+    """Flat engine for RandomForestRegressor / GradientBoostingRegressor"""
+
+    def predict(self, X):
+        return self.raw_predict(X)
+
+
+class FlatTreeClassifier(FlatTreeEnsemble):
+    """Flat engine for RandomForestClassifier / GradientBoostingClassifier"""
+
+    def __init__(self, *args, classes=None, link='identity', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.classes_ = classes
+        self.link = link
+
+    def predict_proba(self, X):
+        raw = self.raw_predict(X)
+        if self.link == 'logistic':
+            # Binary boosting: one raw score per sample
+            positive = 1.0 / (1.0 + np.exp(-raw[:, 0]))
+            return np.column_stack([1.0 - positive, positive])
+        if self.link == 'exponential':
+            positive = 1.0 / (1.0 + np.exp(-2.0 * raw[:, 0]))
+            return np.column_stack([1.0 - positive, positive])
+        if self.link == 'softmax':
+            raw = raw - raw.max(axis=1, keepdims=True)
+            exp = np.exp(raw)
+            return exp / exp.sum(axis=1, keepdims=True)
+        return raw
+
+    def predict_and_proba(self, X):
+        """Predicted labels and class probabilities from a single traversal"""
+        proba = self.predict_proba(X)
+        return self.classes_[np.argmax(proba, axis=1)], proba
+
+    def predict(self, X):
+        return self.predict_and_proba(X)[0]
+
+
+def _flatten_trees(trees):
+    """Concatenate sklearn Tree objects into global node arrays"""
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for tree in trees:
+        n_nodes = tree.node_count
+        is_leaf = tree.children_left == -1
+        node_ids = np.arange(n_nodes)
+
+        # Leaves loop back to themselves and always take the left branch
+        feature.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+        threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+        left.append((np.where(is_leaf, node_ids, tree.children_left) + offset).astype(np.int32))
+        right.append((np.where(is_leaf, node_ids, tree.children_right) + offset).astype(np.int32))
+        value.append(tree.value)
+        roots.append(offset)
+
+        offset += n_nodes
+        max_depth = max(max_depth, tree.max_depth)
+
+    return (np.concatenate(feature), np.concatenate(threshold), np.concatenate(left),
+            np.concatenate(right), np.concatenate(value), np.array(roots, dtype=np.int32), max_depth)
+
+
+def compile_tree_ensemble(model):
+    """Compile a fitted tree ensemble into a flat engine, or None if unsupported"""
+    name = type(model).__name__
+
+    if name in ('RandomForestRegressor', 'ExtraTreesRegressor', 'RandomForestClassifier', 'ExtraTreesClassifier'):
+        if getattr(model, 'n_outputs_', 1) != 1:
+            return None
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        feature, threshold, left, right, value, roots, max_depth = _flatten_trees(trees)
+        n_trees = len(trees)
+        common = dict(
+            roots=roots, tree_output=np.zeros(n_trees, dtype=np.int32),
+            max_depth=max_depth, n_features_in=model.n_features_in_,
+        )
+
+        if name.endswith('Regressor'):
+            # Forest prediction is the mean of the trees
+            return FlatTreeRegressor(
+                feature, threshold, left, right, value[:, 0, 0],
+                tree_weight=np.full(n_trees, 1.0 / n_trees), baseline=np.zeros(()), **common
+            )
+
+        # Each tree votes with its normalized class distribution
+        class_values = value[:, 0, :]
+        class_values = class_values / class_values.sum(axis=1, keepdims=True)
+        return FlatTreeClassifier(
+            feature, threshold, left, right, class_values,
+            tree_weight=np.full((n_trees, 1), 1.0 / n_trees), baseline=np.zeros(len(model.classes_)),
+            classes=np.asarray(model.classes_), link='identity', **common
+        )
+
+    if name in ('GradientBoostingRegressor', 'GradientBoostingClassifier'):
+        if model.init_ != 'zero' and type(model.init_).__name__ not in ('DummyRegressor', 'DummyClassifier'):
+            # A fitted init estimator gives a per-sample baseline we cannot flatten
+            return None
+
+        n_stages, n_outputs = model.estimators_.shape
+        trees = [model.estimators_[stage, k].tree_ for stage in range(n_stages) for k in range(n_outputs)]
+        feature, threshold, left, right, value, roots, max_depth = _flatten_trees(trees)
+        tree_output = np.tile(np.arange(n_outputs, dtype=np.int32), n_stages)
+        tree_weight = np.full(len(trees), model.learning_rate)
+
+        # The init estimator predicts a constant, so take it from any single row
+        baseline = model._raw_predict_init(np.zeros((1, model.n_features_in_), dtype=np.float32))[0]
+        common = dict(
+            roots=roots, tree_output=tree_output, tree_weight=tree_weight,
+            max_depth=max_depth, n_features_in=model.n_features_in_,
+        )
+
+        if name == 'GradientBoostingRegressor':
+            return FlatTreeRegressor(
+                feature, threshold, left, right, value[:, 0, 0], baseline=np.asarray(baseline[0]), **common
+            )
+
+        if n_outputs == 1:
+            link = 'exponential' if getattr(model, 'loss', 'log_loss') == 'exponential' else 'logistic'
+        else:
+            link = 'softmax'
+        return FlatTreeClassifier(
+            feature, threshold, left, right, value[:, 0, 0], baseline=np.asarray(baseline),
+            classes=np.asarray(model.classes_), link=link, **common
+        )
+
+    return None
@@ -0,0 +1,101 @@
+# Streaming ingest for batch uploads
+# Reads the file part of a multipart request (or a raw request body) straight
+# off the WSGI input through a bounded buffer, so parsing and scoring start
+# while the upload is still arriving and memory does not grow with file size
+
+import io
+import shutil
+import tempfile
+
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+
+
+class UploadError(Exception):
+    pass
+
+
+class MultipartFileReader(io.RawIOBase):
+    """Readable stream over one file field of a multipart body, decoded as it is read"""
+
+    def __init__(self, stream, boundary, field='file', read_size=256 * 1024):
+        self._stream = stream
+        self._decoder = MultipartDecoder(boundary.encode('latin-1'))
+        self._read_size = read_size
+        self._pending = memoryview(b'')
+        self._finished = False
+        self.filename = self._open_field(field)
+
+    def _next_event(self):
+        event = self._decoder.next_event()
+        while isinstance(event, NeedData):
+            data = self._stream.read(self._read_size)
+            self._decoder.receive_data(data or None)
+            event = self._decoder.next_event()
+        return event
+
+    def _open_field(self, field):
+        # Skip the preamble and any other form fields until the wanted file starts
+        while True:
+            event = self._next_event()
+            if isinstance(event, File) and event.name == field:
+                return event.filename
+            if isinstance(event, Epilogue):
+                raise UploadError('No file uploaded')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            if self._finished:
+                return 0
+            event = self._next_event()
+            if not isinstance(event, Data):
+                raise UploadError('Malformed multipart upload')
+            self._pending = memoryview(event.data)
+            self._finished = not event.more_data
+
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def open_upload(request, field='file', buffer_size=1024 * 1024):
+    """Buffered stream over the uploaded file and its filename (None for a raw body)"""
+    if request.mimetype == 'multipart/form-data':
+        boundary = request.mimetype_params.get('boundary')
+        if not boundary:
+            raise UploadError('Missing multipart boundary')
+        reader = MultipartFileReader(request.stream, boundary, field)
+        return io.BufferedReader(reader, buffer_size), reader.filename
+    return io.BufferedReader(request.stream, buffer_size), None
+
+
+def spool(source, max_memory):
+    """Copy a stream into a seekable file that stays in memory up to max_memory bytes"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    shutil.copyfileobj(source, spooled, 1024 * 1024)
+    spooled.seek(0)
+    return spooled
+
+
+def hold_until(results, is_ready, max_memory):
+    """Yield results only once is_ready() holds, keeping earlier ones in a spooled buffer.
+
+    Clients that send the whole body before reading the response would deadlock
+    if we wrote results while the upload is still arriving, so scoring runs
+    ahead and its output waits here (on disk past max_memory) instead.
+    """
+    results = iter(results)
+    held = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    try:
+        for part in results:
+            held.write(part.encode() if isinstance(part, str) else part)
+            if is_ready():
+                break
+        held.seek(0)
+        yield from iter(lambda: held.read(1024 * 1024), b'')
+    finally:
+        held.close()
+    yield from results
@@ -0,0 +1,104 @@
+# Startup warm-up for loaded model bundles
+# Reads every model array once so memory-mapped and freshly unpickled pages are
+# resident, then runs synthetic batches through the same serving path real
+# requests use (schema, micro-batcher thread, cache key, fused pipeline) without
+# going through the instrumented model calls, so /metrics only counts traffic
+
+import time
+
+import numpy as np
+
+from inference_pipeline import needs_writable_arrays
+
+# sklearn's Cython Tree exposes its node arrays as properties, not in __dict__
+TREE_ARRAYS = ('children_left', 'children_right', 'feature', 'threshold', 'value')
+
+
+def iter_arrays(obj, max_depth=6, _seen=None):
+    """Yield every NumPy array reachable from obj"""
+    # Keeps every visited object alive, so ids of temporaries (Tree properties) are not reused
+    seen = _seen if _seen is not None else {}
+    if id(obj) in seen or max_depth < 0:
+        return
+    seen[id(obj)] = obj
+
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            for item in obj.ravel():
+                yield from iter_arrays(item, max_depth - 1, seen)
+        else:
+            yield obj
+        return
+    if isinstance(obj, dict):
+        for value in obj.values():
+            yield from iter_arrays(value, max_depth - 1, seen)
+        return
+    if isinstance(obj, (list, tuple)):
+        for item in obj:
+            yield from iter_arrays(item, max_depth - 1, seen)
+        return
+
+    if type(obj).__name__ == 'Tree':
+        for name in TREE_ARRAYS:
+            yield from iter_arrays(getattr(obj, name), max_depth - 1, seen)
+    if hasattr(obj, '__dict__'):
+        for value in vars(obj).values():
+            yield from iter_arrays(value, max_depth - 1, seen)
+
+
+def touch_arrays(obj):
+    """Read every NumPy array reachable from obj, returns the bytes touched"""
+    touched = 0
+    for array in iter_arrays(obj):
+        # A reduction reads every page of the buffer
+        np.ascontiguousarray(array).view(np.uint8).sum()
+        touched += array.nbytes
+    return touched
+
+
+def check_writable(pipeline):
+    """Fail fast when a model that writes to its arrays was loaded read-only"""
+    if not needs_writable_arrays(pipeline):
+        return
+    read_only = sum(1 for array in iter_arrays(pipeline.model) if not array.flags.writeable)
+    if read_only:
+        raise ValueError(f'{pipeline.model_type} has {read_only} read-only arrays but libsvm needs them '
+                         f"writable; load it with MODEL_MMAP_MODE='c' or without mmap")
+
+
+def synthetic_rows(n_rows, n_features, seed=0):
+    """Small positive values: valid input for every model and scaler we ship"""
+    return np.random.default_rng(seed).uniform(0, 10, size=(n_rows, n_features))
+
+
+def warm_up_bundle(bundle, batch_sizes=(1, 32, 1024), rounds=3):
+    """Warm one bundle, returns timings in milliseconds"""
+    check_writable(bundle.pipeline)
+    start = time.perf_counter()
+    touched = touch_arrays(bundle.pipeline)
+    touch_ms = (time.perf_counter() - start) * 1000
+
+    n_features = len(bundle.features)
+    first_call_ms = None
+    for _ in range(rounds):
+        for size in batch_sizes:
+            X = synthetic_rows(size, n_features)
+            call_start = time.perf_counter()
+            bundle.pipeline.predict_and_proba(X)
+            if first_call_ms is None:
+                first_call_ms = (time.perf_counter() - call_start) * 1000
+
+    # Single-row path: exercises schema and cache hashing and starts the micro-batcher
+    # thread. The row is scored on the pipeline directly, since the batcher's calls
+    # are counted in /metrics and warm-up is not traffic
+    row = bundle.schema.row(dict(zip(bundle.features, synthetic_rows(1, n_features)[0].tolist())))
+    bundle.cache.key(row)
+    bundle.batcher.start()
+    bundle.pipeline.predict_and_proba(row.reshape(1, -1))
+
+    return {
+        'touched_bytes': touched,
+        'touch_ms': round(touch_ms, 2),
+        'first_call_ms': round(first_call_ms or 0.0, 2),
+        'total_ms': round((time.perf_counter() - start) * 1000, 2),
+    }